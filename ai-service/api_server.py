@@ -1,58 +1,192 @@
 # FastAPI
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 from pydantic import BaseModel
 # Azure AI Agents
-from travelAgent import get_augmented_prompt, agent, ChatHistoryAgentThread
+import travelAgent
+from travelAgent import get_retrieval_context, init_agent, ChatHistoryAgentThread, plugin_fingerprint
+from plugins.plugin_functions import PromptPlugin
 from semantic_kernel.contents.chat_history import ChatHistory
-from semantic_kernel.contents import ChatMessageContent
+from semantic_kernel.contents import ChatMessageContent, FunctionCallContent
 from semantic_kernel.contents.utils.author_role import AuthorRole
 # Others
-from pymongo import MongoClient, ASCENDING
 from dotenv import load_dotenv
 from datetime import datetime, UTC
+import asyncio
 import json
+import logging
 import os
-import certifi
-import redis.asyncio as redis
-from typing import Optional, List
+import time
+from typing import Literal, Optional, List
+from contextlib import asynccontextmanager
+from response_cache import ResponseCache
+from index_bootstrap import bootstrap_index, corpus_version
+from write_behind import WriteBehindQueue
+from session_lock import SessionLock
+from single_flight import SingleFlight, jittered_ttl
+from cache_codec import create_cache_codec
+from intent_router import create_intent_router
+from clients import create_mongo_client, create_redis_client
+from thread_history import InvalidCursor, read_page, stream_messages
+from db_indexes import MESSAGE_PROJECTION, THREAD_INFO_PROJECTION, check_query_plans, ensure_indexes, latest_messages_query
+from context_window import SummaryPlan, count_tokens, fit_to_budget, load_tokenizer, plan_summary, parse_timestamp, summarize_messages, to_millis
+from metrics import FAST_PATH_REPLIES, start_request_timings, stage_timer, timed, record_cache_lookup, server_timing_header, render_metrics, sample_pools_forever
+from logging_config import configure_logging, debug_mode, start_request_context
 
 # Load environment variables
 load_dotenv()
 
+# Structured logs are written by a background thread, see logging_config.py for LOG_* and DEBUG_MODE
+configure_logging()
+logger = logging.getLogger(__name__)
+
 
 # -------------------------------------------------------------Database Setup------------------------------------------------------------
-# MongoDB setup
-mongo_uri = os.getenv("MONGO_URI")
-if not mongo_uri:
-    raise ValueError("MONGO_URI environment variable is not set")
-
-mongo_client = MongoClient(mongo_uri, tlsCAFile=certifi.where())
-print("Successfully connected to MongoDB from AI-service")
-db = mongo_client["AI-service"]
-threads_collection = db["Threads"]
-msg_collection = db["Messages"]
-
-# Redis setup
-redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST", "localhost"),
-    port=int(os.getenv("REDIS_PORT", 6379)),
-    db=0,
-    decode_responses=False,
-    socket_connect_timeout=5,
-    socket_keepalive=True,
-    health_check_interval=30,
-)
-
-# API setup
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # Replace * later with specific domain name
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"]
-)
+# Clients are created per worker process by init_clients() in the lifespan, never at import,
+# so gunicorn can fork workers (with or without --preload) without sharing sockets or event-loop bound state
+mongo_client = None
+db = None
+threads_collection = None
+msg_collection = None
+redis_client = None
+response_cache = None
+session_lock = None
+write_behind_queue = None
+
+# Persistence mode: write_through (default) saves to MongoDB before replying,
+# write_behind queues new messages in Redis and a background worker writes them to MongoDB
+persistence_mode = os.getenv("PERSISTENCE_MODE", "write_through")
+
+# Thread caches expire after THREAD_CACHE_TTL seconds without reads, each write and read picks a jittered TTL
+thread_cache_ttl = int(os.getenv("THREAD_CACHE_TTL", 3600))
+
+# Cached thread data is msgpack encoded (zstd compressed when large), legacy JSON entries are still read
+cache_codec = create_cache_codec()
+
+# Concurrent cache misses for the same thread share one database load
+thread_loads = SingleFlight("thread_load")
+
+# Token budget for the chat history sent to the model, older turns are folded into a rolling summary
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", 4000))
+
+# User and assistant messages kept in the cached window, whatever leaves it is folded into the summary too
+thread_window_size = int(os.getenv("THREAD_WINDOW_SIZE", 50))
+
+# Older messages read back from the database for one summary refresh, and messages folded per completion call
+summary_max_messages = int(os.getenv("SUMMARY_MAX_MESSAGES", 500))
+summary_chunk_size = 50
+
+# Replies that used these plugin functions are never cached, their answers are not deterministic
+UNCACHEABLE_FUNCTIONS = {"get_random_destination"}
+
+# Availability and temperature questions are answered straight from the plugins, see intent_router.py
+intent_router = create_intent_router()
+
+# /chat/batch: items per request, and turns of all batches of this worker running at once
+batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", 500))
+batch_semaphore = asyncio.Semaphore(int(os.getenv("BATCH_CONCURRENCY", 8)))
+# Session runners of batches, referenced here so the turns they are in finish after the client went away
+batch_tasks = set()
+
+# Thread history API: largest page, and documents per MongoDB round-trip when streaming
+history_max_page = int(os.getenv("HISTORY_MAX_PAGE", 200))
+history_batch_size = int(os.getenv("HISTORY_BATCH_SIZE", 100))
+
+
+def init_clients():
+    """Create this worker's clients, the agent and everything built on them"""
+    global mongo_client, db, threads_collection, msg_collection, redis_client
+    global response_cache, session_lock, write_behind_queue
+
+    # MongoDB setup
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI environment variable is not set")
+
+    # Async driver so Mongo round-trips never block the event loop serving /chat, pool settings live in clients.py
+    mongo_client = create_mongo_client(mongo_uri)
+    db = mongo_client["AI-service"]
+    threads_collection = db["Threads"]
+    msg_collection = db["Messages"]
+
+    # Redis setup
+    redis_client = create_redis_client()
+
+    # Kernel, agent and retriever of this worker, retrieval results are shared across workers and pods through Redis
+    init_agent()
+    travelAgent.retrieval_cache.attach_redis(redis_client)
+
+    # Opt-in cache of replies to stateless, FAQ-style questions
+    response_cache = ResponseCache(
+        redis_client,
+        enabled=os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true",
+        threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.85)),
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL", 3600)),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 500)),
+        max_history=int(os.getenv("RESPONSE_CACHE_MAX_HISTORY", 0))
+    )
+
+    # Requests of one session run one at a time across workers and pods, so they never race on the same window
+    session_lock = SessionLock(
+        redis_client,
+        ttl_ms=int(os.getenv("SESSION_LOCK_TTL_MS", 30000)),
+        timeout=float(os.getenv("SESSION_LOCK_TIMEOUT", 60))
+    )
+
+    # One write-behind consumer per worker, named after its process
+    if persistence_mode == "write_behind":
+        write_behind_queue = WriteBehindQueue(
+            redis_client,
+            threads_collection,
+            msg_collection,
+            batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 200)),
+            retry_idle_ms=int(os.getenv("WRITE_BEHIND_RETRY_IDLE_MS", 30000))
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Runs in every worker after the fork: create and warm the clients, drain and close them on shutdown"""
+    configure_logging()
+    init_clients()
+    # Token budgeting needs the tokenizer, load it off the event loop before the first request
+    await asyncio.to_thread(load_tokenizer)
+    await startup(app)
+    try:
+        yield
+    finally:
+        await shutdown(app)
+
+
+router = APIRouter()
+
+
+async def server_timing_middleware(request: Request, call_next):
+    """Collect per-stage timings of the request and report them in the Server-Timing header"""
+    timings = start_request_timings()
+    response = await call_next(request)
+    # Streaming responses send their headers before the stages inside the stream have run
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+async def request_context_middleware(request: Request, call_next):
+    """Tag every log record of the request with its X-Request-ID and log one line per request"""
+    request_id = start_request_context(request.headers.get("X-Request-ID"))
+    start = time.perf_counter()
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    logger.info(
+        "%s %s %d",
+        request.method,
+        request.url.path,
+        response.status_code,
+        extra={"duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+    )
+    return response
 
 
 class Message(BaseModel):
@@ -60,6 +194,10 @@ class Message(BaseModel):
     session_id: str
 
 
+class BatchRequest(BaseModel):
+    items: List[Message]
+
+
 # -------------------------------------------------------------Redis Caching Functions------------------------------------------------------------
 
 """ Cache thread structure
@@ -72,25 +210,38 @@ thread_info:{session_id}
 """
 
 """ Cache message structure
-thread_msg:{thread_id}
-{
-    "role": "USER" | "SYSTEM" | "ASSISTANT"
-    "content": "text of the message",    
-    "timestamp": ISODate("..."),
-}
+thread_msg:{thread_id}  (Redis list, oldest -> newest, one encoded entry per message)
+[
+    {
+        "role": "USER" | "SYSTEM" | "ASSISTANT"
+        "content": "text of the message",
+        "timestamp": ISODate("..."),
+    },
+    ...
+]
+"""
+
+""" Cache encoding
+Values above are stored through cache_codec (msgpack, zstd for large entries), see cache_codec.py
+"""
+
+""" Cache expiry
+Reads slide the TTL forward (GETEX, LRANGE + EXPIRE in the same round-trip), so active sessions never
+expire, and every TTL is jittered so keys written in the same burst do not expire together
 """
 
 async def get_cached_thread_info(session_id: str) -> Optional[dict]:
-    """Get thread info (thread_id, message_count) from cache"""
+    """Get thread info (thread_id, message_count) from cache, extending its TTL"""
     try:
         cache_thread_info_key = f"thread_info:{session_id}"
-        cached_data = await redis_client.get(cache_thread_info_key)
+        cached_data = await redis_client.getex(cache_thread_info_key, ex=jittered_ttl(thread_cache_ttl))
+        record_cache_lookup("thread_info", hit=bool(cached_data))
         
         if cached_data:
-            return json.loads(cached_data.decode('utf-8'))
+            return cache_codec.decode(cached_data)
         
     except Exception as e:
-        print(f"Cache miss for thread info: {e}")
+        logger.warning("Cache miss for thread info: %s", e)
     
     return None
 
@@ -105,44 +256,125 @@ async def cache_thread_info(session_id: str, thread_id: str, msg_count: int):
             "last_updated": datetime.now(UTC).isoformat()
         }
 
-        await redis_client.set(cache_thread_info_key, json.dumps(cached_data), ex=3600)
+        await redis_client.set(cache_thread_info_key, cache_codec.encode(cached_data), ex=jittered_ttl(thread_cache_ttl))
 
     except Exception as e:
-        print(f"Failed to cache thread info: {e}")
+        logger.warning("Failed to cache thread info: %s", e)
 
 
 async def get_cached_messages(thread_id: str, limit: int=50) -> Optional[List[dict]]:
     """
         Get latest messages of current thread chat history from cache. 
         50 messages by default)
+        Only the tail of the list is read from Redis, the TTL is extended in the same round-trip
     """
     try:
         cache_thread_message_key = f"thread_msg:{thread_id}"
         
-        cached_data = await redis_client.get(cache_thread_message_key)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.lrange(cache_thread_message_key, -limit, -1)
+            pipe.expire(cache_thread_message_key, jittered_ttl(thread_cache_ttl))
+            cached_data, _ = await pipe.execute()
+        record_cache_lookup("thread_msg", hit=bool(cached_data))
         if cached_data:
-            messages = json.loads(cached_data.decode('utf-8'))
-            return messages[-limit:] if len(messages) > limit else messages   
+            return [cache_codec.decode(entry) for entry in cached_data]
         
     except Exception as e:
-        print(f"Cache miss for recent messages: {e}")
+        logger.warning("Cache miss for recent messages: %s", e)
     
     return None
 
 
 async def cache_messages(thread_id: str, messages: List[dict], limit: int=50):
     """
-        Cache the latest 50 messages
+        Replace the cached window with the latest 50 messages.
+        Used when the window is rebuilt from the database
     """
     try:
         cache_thread_message_key = f"thread_msg:{thread_id}"
         
         latest_messages = messages[-limit:] if len(messages) > limit else messages 
+        if not latest_messages:
+            return
+        
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(cache_thread_message_key)
+            pipe.rpush(cache_thread_message_key, *[cache_codec.encode(msg) for msg in latest_messages])
+            pipe.expire(cache_thread_message_key, jittered_ttl(thread_cache_ttl))
+            await pipe.execute()
+    
+    except Exception as e:
+        logger.warning("Failed to cache the latest messages: %s", e)
+
+
+async def cache_saved_thread(session_id: str, thread_id: str, msg_count: int, messages: List[dict], limit: int=50, create: bool=False, queue_entry: Optional[dict]=None):
+    """
+        Update thread info and append new messages to the cached window (trimmed to the latest 50) in one MULTI.
+        Unless the thread is new (create=True), RPUSHX only appends to an existing window,
+        so an expired window is rebuilt from the database on the next load instead of being cached partially.
+        In write-behind mode the queued database write (queue_entry) joins the same transaction, and failures are raised
+    """
+    try:
+        cache_thread_info_key = f"thread_info:{session_id}"
+        cache_thread_message_key = f"thread_msg:{thread_id}"
+        cached_data = {
+            "thread_id": thread_id,
+            "msg_count": msg_count,
+            "last_updated": datetime.now(UTC).isoformat()
+        }
+        
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(cache_thread_info_key, cache_codec.encode(cached_data), ex=jittered_ttl(thread_cache_ttl))
+            if messages:
+                push = pipe.rpush if create else pipe.rpushx
+                push(cache_thread_message_key, *[cache_codec.encode(msg) for msg in messages])
+                pipe.ltrim(cache_thread_message_key, -limit, -1)
+                pipe.expire(cache_thread_message_key, jittered_ttl(thread_cache_ttl))
+            if queue_entry is not None:
+                write_behind_queue.add_to_pipeline(pipe, queue_entry)
+            await pipe.execute()
+    
+    except Exception as e:
+        logger.warning("Failed to cache the saved thread: %s", e)
+        if queue_entry is not None:
+            raise
+
+""" Cache summary structure
+thread_summary:{thread_id}
+{
+    "summary": "rolling summary of the turns that no longer fit the token budget",
+    "summary_until": ISODate("...")  (timestamp of the newest message folded into the summary)
+}
+"""
+
+async def get_cached_summary(thread_id: str) -> Optional[dict]:
+    """Get the rolling summary of a thread from cache, extending its TTL"""
+    try:
+        cache_thread_summary_key = f"thread_summary:{thread_id}"
+        cached_data = await redis_client.getex(cache_thread_summary_key, ex=jittered_ttl(thread_cache_ttl))
         
-        await redis_client.set(cache_thread_message_key, json.dumps(latest_messages), ex=3600)
+        if cached_data:
+            return cache_codec.decode(cached_data)
+        
+    except Exception as e:
+        logger.warning("Cache miss for thread summary: %s", e)
     
+    return None
+
+
+async def cache_summary(thread_id: str, summary: str, summary_until: Optional[str]):
+    """Cache the rolling summary of a thread, an empty summary is cached too so new threads skip the database"""
+    try:
+        cache_thread_summary_key = f"thread_summary:{thread_id}"
+        cached_data = {
+            "summary": summary,
+            "summary_until": summary_until
+        }
+
+        await redis_client.set(cache_thread_summary_key, cache_codec.encode(cached_data), ex=jittered_ttl(thread_cache_ttl))
+
     except Exception as e:
-        print(f"Failed to cache the latest messages: {e}")
+        logger.warning("Failed to cache thread summary: %s", e)
 
 # -------------------------------------------------------------Serialization & Deserialization------------------------------------------------------------
 """Stateless Thread Management"""
@@ -155,6 +387,8 @@ async def cache_messages(thread_id: str, messages: List[dict], limit: int=50):
     "msg_count": 25,  
     "last_updated": ISODate("...")
     "created_at": ISODate("...")
+    "summary": "rolling summary of older turns",
+    "summary_until": ISODate("...")
 }
 """
 
@@ -170,108 +404,11 @@ async def cache_messages(thread_id: str, messages: List[dict], limit: int=50):
 """
 
 
-async def load_thread(session_id: str) -> ChatHistoryAgentThread:
-    """
-    STATELESS: Rebuild thread from recent context each time
-    No persistent objects in memory - everything reconstructed per request
-    """
-    
-    cached_thread_info = await get_cached_thread_info(session_id)
-    if cached_thread_info:
-        # Load thread info from cache
-        thread_id = cached_thread_info["thread_id"]
-    else:
-        # Fallback to load thread info from database
-        thread_info = threads_collection.find_one({"session_id": session_id})
-        if not thread_info:
-            # Create new thread for new session
-            return ChatHistoryAgentThread()
-        
-        thread_id = thread_info["thread_id"]
-        msg_count = thread_info.get("msg_count", 0)
-        
-        # Cache the thread info from database if its not in redis cache
-        await cache_thread_info(session_id, thread_id, msg_count)
-    
-    # Load thread messages from cache
-    latest_msgs = await get_cached_messages(thread_id, limit=50)
-    
-    if not latest_msgs:
-        # Fallback to load thread messages from database
-        cursor = msg_collection.find({ 
-            "thread_id": thread_id,
-            "role": {"$in": ["USER", "ASSISTANT"]}  # Only load user and assistant messages
-        }).sort("timestamp", -1).limit(50)
-        
-        latest_docs = list(cursor)
-        latest_docs.reverse()
-        
-        latest_msgs = []
-        for doc in latest_docs:
-            latest_msgs.append({
-                "role": doc["role"],
-                "content": doc.get("content", ""),
-                "timestamp": doc.get("timestamp", datetime.now(UTC)).isoformat()
-            })
-        
-        if latest_msgs:
-            # Cache the latest messages from database to redis cahce
-            await cache_messages(thread_id, latest_msgs)
-    
-    chat_history = ChatHistory()
-    
-    for msg_data in latest_msgs:
-        if msg_data["role"] not in ["USER", "ASSISTANT"]:
-            continue
-        
-        role = AuthorRole[msg_data["role"].upper()]
-        content = msg_data["content"]
-        
-        chat_history.add_message(
-            ChatMessageContent(
-                role=role,
-                content=content,
-            )
-        )
-    
-    return ChatHistoryAgentThread(chat_history=chat_history, thread_id=thread_id)
-        
-
-async def save_thread(session_id: str, thread: ChatHistoryAgentThread):
-    """
-    STATELESS: Save only the new messages added in this request
-    Figure out what's new by comparing with database count
-    """
-    
-    thread_id = thread._id
-    total_msg_count = len(thread)
-    
-    cached_thread_info = await get_cached_thread_info(session_id)
-    
-    # Calculate the number of new messages
-    if cached_thread_info:
-        existing_msg_count = cached_thread_info["msg_count"]
-    else:
-        thread_doc = threads_collection.find_one({"session_id": session_id})
-        existing_msg_count = thread_doc.get("msg_count", 0) if thread_doc else 0
-        
-    new_msg_count = total_msg_count - existing_msg_count
-    
-    if new_msg_count <= 0:
-        # No new messages to save
-        return
-    
-    new_msgs = []
-    count = 1
-    async for msg in thread.get_messages():
-        if count > existing_msg_count:
-            new_msgs.append(msg)
-        count += 1
-    
-    # Save messages to database
+def serialize_messages(thread_id: str, msgs: List[ChatMessageContent]) -> List[dict]:
+    """Convert agent messages into Messages documents"""
     serialized_msgs = []
     
-    for msg in new_msgs:
+    for msg in msgs:
         items_data = []
         if msg.items:
             for item in msg.items:
@@ -310,111 +447,718 @@ async def save_thread(session_id: str, thread: ChatHistoryAgentThread):
             "timestamp": datetime.now(UTC)
         }
         serialized_msgs.append(msg_doc)
+    
+    return serialized_msgs
+
+
+def build_chat_history(summary: str, msgs: List[dict]) -> ChatHistory:
+    """Rebuild the agent's chat history from the rolling summary and cached messages"""
+    chat_history = ChatHistory()
+    
+    if summary:
+        chat_history.add_message(
+            ChatMessageContent(
+                role=AuthorRole.SYSTEM,
+                content=f"Summary of the earlier conversation: {summary}",
+            )
+        )
+    
+    for msg_data in msgs:
+        role = AuthorRole[msg_data["role"].upper()]
+        content = msg_data["content"]
         
-    if serialized_msgs:
-        try:
-            msg_collection.insert_many(serialized_msgs)
-        except Exception as e:
-            print(f"Failed to save serialized chat history messages: {e}")
-            raise
+        chat_history.add_message(
+            ChatMessageContent(
+                role=role,
+                content=content,
+            )
+        )
+    
+    return chat_history
+
+
+# One summary refresh in flight per thread in this worker
+summary_tasks = {}
+
+
+async def load_thread_summary(session_id: str, thread_id: str) -> dict:
+    """Rolling summary of the thread from cache, falling back to the Threads document"""
+    summary_info = await get_cached_summary(thread_id)
+    if summary_info is not None:
+        return summary_info
     
-    # Update database's thread info with new counts
-    threads_collection.update_one(
-        {"session_id": session_id},
-        {
-            "$set": {
-                "msg_count": total_msg_count,
-                "last_updated": datetime.now(UTC)
+    return await thread_loads.do(
+        f"thread_summary:{thread_id}",
+        lambda: fetch_thread_summary(session_id, thread_id)
+    )
+
+
+async def fetch_thread_summary(session_id: str, thread_id: str) -> dict:
+    """Read the rolling summary from the Threads document and cache it"""
+    thread_doc = await threads_collection.find_one({"session_id": session_id}, {"summary": 1, "summary_until": 1})
+    thread_doc = thread_doc or {}
+    summary_until = parse_timestamp(thread_doc.get("summary_until"))
+    summary_info = {
+        "summary": thread_doc.get("summary", ""),
+        "summary_until": summary_until.isoformat() if summary_until else None
+    }
+    await cache_summary(thread_id, summary_info["summary"], summary_info["summary_until"])
+    return summary_info
+
+
+async def fetch_messages_before(thread_id: str, after, before) -> List[dict]:
+    """User and assistant messages after `after` (None: from the start) up to and including `before`, oldest first"""
+    timestamp_range = {"$lte": before}
+    if after is not None:
+        timestamp_range["$gt"] = after
+
+    query = latest_messages_query(thread_id)
+    query["timestamp"] = timestamp_range
+    cursor = msg_collection.find(query, MESSAGE_PROJECTION).sort("timestamp", -1).limit(summary_max_messages)
+    docs = await cursor.to_list(length=summary_max_messages)
+    if len(docs) == summary_max_messages:
+        logger.warning("Summarizing only the latest %d older messages of thread %s", summary_max_messages, thread_id)
+    docs.reverse()
+
+    return [
+        {"role": doc["role"], "content": doc.get("content", ""), "timestamp": doc["timestamp"].isoformat()}
+        for doc in docs
+    ]
+
+
+async def refresh_summary(session_id: str, thread_id: str, summary: str, summary_until, plan: SummaryPlan, window: List[dict]):
+    """Fold messages that fell out of the token budget or out of the cached window into the thread's rolling summary"""
+    try:
+        messages = plan.messages
+        if plan.read_before is not None:
+            # Messages trimmed from the window, skipping the window's own messages the range also matches
+            in_window = {(msg["role"], msg["content"], to_millis(msg["timestamp"])) for msg in window}
+            older = await fetch_messages_before(thread_id, to_millis(summary_until), plan.read_before)
+            older = [msg for msg in older if (msg["role"], msg["content"], to_millis(msg["timestamp"])) not in in_window]
+            messages = older + messages
+
+        new_summary = summary
+        for start in range(0, len(messages), summary_chunk_size):
+            new_summary = await summarize_messages(
+                travelAgent.chat_completion_service, new_summary, messages[start:start + summary_chunk_size]
+            )
+        
+        await threads_collection.update_one(
+            {"session_id": session_id},
+            {
+                "$set": {
+                    "summary": new_summary,
+                    "summary_until": plan.summary_until
+                },
+                "$setOnInsert": {
+                    "thread_id": thread_id,
+                    "created_at": datetime.now(UTC)
+                }
             },
-            "$setOnInsert": {
-                "thread_id": thread_id,
-                "created_at": datetime.now(UTC)
-            }
-        },
-        upsert=True
+            upsert=True
+        )
+        await cache_summary(thread_id, new_summary, plan.summary_until.isoformat())
+    
+    except Exception as e:
+        logger.warning("Failed to refresh thread summary: %s", e)
+
+
+def schedule_summary_refresh(session_id: str, thread_id: str, summary: str, summary_until, plan: SummaryPlan, window: List[dict]):
+    """Refresh the summary in the background, the current request goes on with the previous one"""
+    if thread_id in summary_tasks:
+        return
+    
+    task = asyncio.create_task(refresh_summary(session_id, thread_id, summary, summary_until, plan, window))
+    summary_tasks[thread_id] = task
+    task.add_done_callback(lambda _: summary_tasks.pop(thread_id, None))
+
+
+async def fetch_thread_info(session_id: str) -> Optional[dict]:
+    """Read thread info from the database and cache it, None for a new session"""
+    thread_info = await threads_collection.find_one({"session_id": session_id}, THREAD_INFO_PROJECTION)
+    if not thread_info:
+        return None
+    
+    thread_id = thread_info["thread_id"]
+    msg_count = thread_info.get("msg_count", 0)
+    
+    # Cache the thread info from database if its not in redis cache
+    await cache_thread_info(session_id, thread_id, msg_count)
+    return {"thread_id": thread_id, "msg_count": msg_count}
+
+
+async def fetch_latest_messages(thread_id: str) -> List[dict]:
+    """Read the latest window of user and assistant messages from the database and cache them"""
+    # Served by the thread_role_timestamp index, only the fields the history needs are fetched
+    cursor = msg_collection.find(latest_messages_query(thread_id), MESSAGE_PROJECTION).sort("timestamp", -1).limit(thread_window_size)
+    
+    latest_docs = await cursor.to_list(length=thread_window_size)
+    latest_docs.reverse()
+    
+    latest_msgs = []
+    for doc in latest_docs:
+        latest_msgs.append({
+            "role": doc["role"],
+            "content": doc.get("content", ""),
+            "timestamp": doc.get("timestamp", datetime.now(UTC)).isoformat()
+        })
+    
+    if latest_msgs:
+        # Cache the latest messages from database to redis cahce
+        await cache_messages(thread_id, latest_msgs, limit=thread_window_size)
+    
+    return latest_msgs
+
+
+async def load_thread(session_id: str) -> tuple[ChatHistoryAgentThread, int]:
+    """
+    STATELESS: Rebuild thread from recent context each time
+    No persistent objects in memory - everything reconstructed per request
+    Returns the thread and the number of messages already saved for it.
+    On a cache miss, concurrent loads of the same thread share one database read
+    """
+    
+    thread_info = await get_cached_thread_info(session_id)
+    if not thread_info:
+        # Fallback to load thread info from database
+        thread_info = await thread_loads.do(f"thread_info:{session_id}", lambda: fetch_thread_info(session_id))
+        if not thread_info:
+            # Create new thread for new session
+            return ChatHistoryAgentThread(), 0
+    
+    thread_id = thread_info["thread_id"]
+    msg_count = thread_info.get("msg_count", 0)
+    
+    # Load thread messages and the rolling summary from cache
+    latest_msgs, summary_info = await asyncio.gather(
+        get_cached_messages(thread_id, limit=thread_window_size),
+        load_thread_summary(session_id, thread_id)
     )
     
-    # Update cached's thread_info with new counts
-    await cache_thread_info(session_id, thread_id, total_msg_count)
-    
-    # Update cached's latest messages with new messages
-    if serialized_msgs:
-        # Convert to cache format
-        cache_msgs = []
-        for msg_doc in serialized_msgs:
-            cache_msgs.append({
-                "role": msg_doc["role"],
-                "content": msg_doc["content"],
-                "timestamp": msg_doc["timestamp"].isoformat()
-            })
-            
-        existing_cached_msg = await get_cached_messages(thread_id) or []
-        updated_msg = existing_cached_msg + cache_msgs
+    if not latest_msgs:
+        # Fallback to load thread messages from database
+        latest_msgs = await thread_loads.do(f"thread_msg:{thread_id}", lambda: fetch_latest_messages(thread_id))
+    
+    # Keep the newest messages that fit the token budget, what no longer fits goes into the summary,
+    # and so does anything a full window has already trimmed
+    summary = summary_info.get("summary", "")
+    summary_until = summary_info.get("summary_until")
+    window_full = len(latest_msgs) >= thread_window_size
+    latest_msgs = [msg for msg in latest_msgs if msg["role"] in ["USER", "ASSISTANT"]]
+    kept_msgs, _ = fit_to_budget(latest_msgs, context_token_budget - count_tokens(summary))
+    
+    plan = plan_summary(latest_msgs, kept_msgs, summary_until, window_full)
+    if plan is not None:
+        schedule_summary_refresh(session_id, thread_id, summary, summary_until, plan, latest_msgs)
+    
+    chat_history = build_chat_history(summary, kept_msgs)
+    
+    return ChatHistoryAgentThread(chat_history=chat_history, thread_id=thread_id), msg_count
+        
+
+async def save_thread(session_id: str, thread: ChatHistoryAgentThread, history_len: int, msg_count: int):
+    """
+    STATELESS: Save only the new messages added in this request
+    New messages are the ones appended after the history_len messages load_thread put in the thread,
+    msg_count is the saved message count load_thread read, so no extra lookup is needed here.
+    Costs one MongoDB round-trip (insert and count update run concurrently) and one Redis round-trip (single MULTI)
+    """
+    
+    thread_id = thread._id
+    new_msg_count = len(thread) - history_len
+    
+    if new_msg_count <= 0:
+        # No new messages to save
+        return
+    
+    total_msg_count = msg_count + new_msg_count
+    
+    new_msgs = []
+    count = 1
+    async for msg in thread.get_messages():
+        if count > history_len:
+            new_msgs.append(msg)
+        count += 1
+    
+    # Save messages to database
+    serialized_msgs = serialize_messages(thread_id, new_msgs)
         
-        await cache_messages(thread_id, updated_msg)
+    # Only user and assistant messages are read back, tool messages would take window slots
+    cache_msgs = []
+    for msg_doc in serialized_msgs:
+        if msg_doc["role"] not in ["USER", "ASSISTANT"]:
+            continue
+        cache_msgs.append({
+            "role": msg_doc["role"],
+            "content": msg_doc["content"],
+            "timestamp": msg_doc["timestamp"].isoformat()
+        })
+    
+    if write_behind_queue is not None:
+        # Write-behind: the cache stays authoritative for reads, MongoDB is written by the background worker
+        queue_entry = WriteBehindQueue.build_entry(session_id, thread_id, total_msg_count, serialized_msgs)
+        await cache_saved_thread(session_id, thread_id, total_msg_count, cache_msgs, limit=thread_window_size, create=msg_count == 0, queue_entry=queue_entry)
+        return
+    
+    # Save messages and update database's thread info concurrently, one MongoDB round-trip.
+    # $max keeps the highest count whatever order the writes of a session land in.
+    # A failed insert takes back the count it advanced, unless a later save has moved it on since
+    now = datetime.now(UTC)
+    inserted, updated = await asyncio.gather(
+        msg_collection.insert_many(serialized_msgs),
+        threads_collection.update_one(
+            {"session_id": session_id},
+            {
+                "$max": {"msg_count": total_msg_count, "last_updated": now},
+                "$setOnInsert": {"thread_id": thread_id, "created_at": now}
+            },
+            upsert=True
+        ),
+        return_exceptions=True
+    )
+    if isinstance(inserted, BaseException):
+        logger.error("Failed to save serialized chat history messages: %s", inserted)
+        if not isinstance(updated, BaseException):
+            try:
+                await threads_collection.update_one(
+                    {"session_id": session_id, "msg_count": total_msg_count},
+                    {"$set": {"msg_count": msg_count}}
+                )
+            except Exception as e:
+                logger.error("Failed to restore msg_count of session %s: %s", session_id, e)
+        raise inserted
+    if isinstance(updated, BaseException):
+        logger.error("Failed to update thread info: %s", updated)
+        raise updated
+    
+    # Update cached's thread_info and latest messages in a single Redis round-trip
+    await cache_saved_thread(session_id, thread_id, total_msg_count, cache_msgs, limit=thread_window_size, create=msg_count == 0)
     
 
 
+# -------------------------------------------------------------Chat Pipeline------------------------------------------------------------
+
+async def prepare_chat(session_id: str, user_input: str) -> tuple[ChatHistoryAgentThread, int, str, str]:
+    """
+    Load the thread and the retrieval context concurrently, they are independent.
+    Returns the thread, its saved message count, the retrieval context and the message to send to the agent
+    """
+    (thread, msg_count), retrieval_context = await asyncio.gather(
+        timed("load_thread", load_thread(session_id)),
+        timed("retrieval", get_retrieval_context(user_input))
+    )
+    logger.debug("Loaded thread %s with %d messages", thread._id, len(thread))
+
+    # Combine the augmented prompt with user input
+    augmented_prompt = PromptPlugin.build_augmented_prompt(user_input, retrieval_context)
+    combined_messages = f"Here is relevant information: {augmented_prompt}\n\nUser: {user_input}"
+
+    return thread, msg_count, retrieval_context, combined_messages
+
+
+async def answer_routed(session_id: str, user_input: str) -> Optional[tuple[ChatHistoryAgentThread, int, int, str]]:
+    """
+    Answer a question the intent router recognizes without retrieval or the model.
+    Returns the thread with the exchange added, its saved message count, its history length and the reply, None otherwise
+    """
+    if intent_router is None:
+        return None
+    routed = await intent_router.route(user_input)
+    if routed is None:
+        return None
+
+    thread, msg_count = await timed("load_thread", load_thread(session_id))
+    history_len = len(thread)
+    await add_reply_to_thread(thread, user_input, routed.reply)
+    FAST_PATH_REPLIES.labels(intent=routed.intent).inc()
+    logger.info("Answered %s question about %s without the model", routed.intent, routed.destination)
+    return thread, msg_count, history_len, routed.reply
+
+
+async def get_cached_reply(user_input: str, retrieval_context: str, thread: ChatHistoryAgentThread) -> Optional[str]:
+    """
+    Look up a cached reply for a stateless question.
+    On a hit the exchange is added to the thread so it is persisted like an agent reply
+    """
+    if not response_cache.enabled or len(thread) > response_cache.max_history:
+        return None
+
+    fingerprint = ResponseCache.fingerprint(retrieval_context, plugin_fingerprint)
+    cached_reply = await response_cache.lookup(user_input, fingerprint)
+    return cached_reply
+
+
+async def add_reply_to_thread(thread: ChatHistoryAgentThread, combined_messages: str, reply: str):
+    """Add an exchange the agent did not produce (cached or routed reply), it is persisted like an agent reply"""
+    await thread.on_new_message(ChatMessageContent(role=AuthorRole.USER, content=combined_messages))
+    await thread.on_new_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content=reply, name=travelAgent.agent.name))
+
+
+async def cache_reply(user_input: str, retrieval_context: str, thread: ChatHistoryAgentThread, history_len: int, reply: str):
+    """Cache the agent's reply unless the session had history or the reply used a non-deterministic plugin"""
+    if not response_cache.enabled or history_len > response_cache.max_history:
+        return
+
+    count = 0
+    async for msg in thread.get_messages():
+        count += 1
+        if count <= history_len:
+            continue
+        for item in msg.items:
+            if isinstance(item, FunctionCallContent) and item.function_name in UNCACHEABLE_FUNCTIONS:
+                return
+
+    fingerprint = ResponseCache.fingerprint(retrieval_context, plugin_fingerprint)
+    await response_cache.store(user_input, fingerprint, reply)
+
+
+def log_chat_turn(thread: ChatHistoryAgentThread, history_len: int):
+    """O(1) summary of the saved turn, the new messages themselves are only logged in DEBUG_MODE"""
+    logger.info("Saved %d new messages to thread %s", len(thread) - history_len, thread._id)
+    if debug_mode():
+        for msg in thread._chat_history.messages[history_len:][-3:]:
+            logger.debug("[%s] %s", msg.role.name, (msg.content or "")[:100])
+
+
+async def run_chat(session_id: str, user_input: str) -> str:
+    """One chat turn: load, answer and save the thread, returns the reply"""
+    # Requests of the same session run in order, from loading the thread until it is saved
+    async with session_lock.hold(session_id):
+        # Questions a plugin answers on its own skip retrieval and the model
+        routed = await answer_routed(session_id, user_input)
+        if routed is not None:
+            thread, msg_count, history_len, reply = routed
+        else:
+            # Load thread and retrieval context, then build the agent message
+            thread, msg_count, retrieval_context, combined_messages = await prepare_chat(session_id, user_input)
+            history_len = len(thread)
+
+            # Get AI response, skipping the LLM when a stateless question was answered before
+            reply = await get_cached_reply(user_input, retrieval_context, thread)
+            if reply is not None:
+                await add_reply_to_thread(thread, combined_messages, reply)
+            else:
+                async with stage_timer("agent"):
+                    response = await travelAgent.agent.get_response(messages=combined_messages, thread=thread)
+                reply = response.message.content
+                await cache_reply(user_input, retrieval_context, thread, history_len, reply)
+
+        # Save thread
+        async with stage_timer("save_thread"):
+            await save_thread(session_id, thread, history_len, msg_count)
+
+    log_chat_turn(thread, history_len)
+    return reply
+
+
+async def run_batch(items: List[Message]):
+    """
+    Run the turns of a batch concurrently, at most BATCH_CONCURRENCY per worker, and yield one NDJSON line
+    per turn as it completes. Turns of the same session run one after another in the order they were sent
+    """
+    results = asyncio.Queue()
+    client_gone = asyncio.Event()
+
+    async def run_session(turns: List[tuple[int, Message]]):
+        for index, item in turns:
+            try:
+                async with batch_semaphore:
+                    # Turns that have not started are skipped once nobody reads the results
+                    if client_gone.is_set():
+                        return
+                    reply = await run_chat(item.session_id, item.message.strip())
+                result = {"index": index, "session_id": item.session_id, "reply": reply}
+            except Exception as e:
+                logger.exception("Error in chat batch item %d: %s", index, e)
+                result = {"index": index, "session_id": item.session_id, "error": str(e)}
+            results.put_nowait(result)
+
+    sessions = {}
+    for index, item in enumerate(items):
+        sessions.setdefault(item.session_id, []).append((index, item))
+    for turns in sessions.values():
+        task = asyncio.create_task(run_session(turns))
+        batch_tasks.add(task)
+        task.add_done_callback(batch_tasks.discard)
+
+    try:
+        for _ in range(len(items)):
+            yield json.dumps(await results.get()) + "\n"
+    finally:
+        # The client went away: turns already running finish and save their thread, the rest never start
+        client_gone.set()
+
+
 # -------------------------------------------------------------Main API------------------------------------------------------------
-@app.on_event("startup")
-async def startup_event():
+async def run_index_bootstrap():
+    # The BM25 retriever builds its own index, nothing reads the Azure one
+    if os.getenv("RETRIEVER", "azure") == "bm25":
+        return
+
+    # Every worker starts up at once, only the first one to take the key syncs the index.
+    # Keyed by corpus version so a deploy with new documents never waits for the previous one's lock
+    lock_key = f"index_bootstrap_lock:{corpus_version}"
+    acquired = False
+    try:
+        acquired = await redis_client.set(lock_key, os.getpid(), nx=True, ex=600)
+        if acquired:
+            await bootstrap_index()
+    except Exception as e:
+        logger.error("Index bootstrap failed in AI-service: %s", e)
+    finally:
+        # Released when done (or failed) so the next start up retries instead of waiting out the expiry
+        if acquired:
+            try:
+                await redis_client.delete(lock_key)
+            except Exception as e:
+                logger.warning("Failed to release %s: %s", lock_key, e)
+
+
+async def startup(app: FastAPI):
+    # Open the first connections now so the first requests skip the TCP and TLS handshakes
+    try:
+        await mongo_client.admin.command("ping")
+        logger.info("MongoDB connected in AI-service")
+        await ensure_indexes(threads_collection, msg_collection)
+        await check_query_plans(threads_collection, msg_collection)
+    except Exception as e:
+        logger.error("MongoDB connection failed in AI-service: %s", e)
+
+    try:
+        await travelAgent.retriever.open()
+    except Exception as e:
+        logger.error("Failed to open retriever in AI-service: %s", e)
+
     try:
         await redis_client.ping()
-        print(f"Redis Connected in AI-service: {os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', 6379)}")
+        logger.info("Redis connected in AI-service: %s:%s", os.getenv("REDIS_HOST", "localhost"), os.getenv("REDIS_PORT", 6379))
     except Exception as e:
-        print(f"Redis connection failed in AI-service: {e}")
-        
-@app.on_event("shutdown")
-async def shutdown_event():
+        logger.error("Redis connection failed in AI-service: %s", e)
+
+    if write_behind_queue is not None:
+        try:
+            await write_behind_queue.start()
+            logger.info("Write-behind persistence worker started")
+        except Exception as e:
+            logger.error("Failed to start write-behind worker in AI-service: %s", e)
+
+    # Sync the search index in the background so it never delays startup, it is a no-op when already up to date
+    if os.getenv("INDEX_BOOTSTRAP_ON_STARTUP", "true").lower() == "true":
+        app.state.index_bootstrap_task = asyncio.create_task(run_index_bootstrap())
+
+    app.state.pool_sampler_task = asyncio.create_task(
+        sample_pools_forever(float(os.getenv("POOL_METRICS_INTERVAL", 5)))
+    )
+
+
+async def shutdown(app: FastAPI):
+    for task_name in ("index_bootstrap_task", "pool_sampler_task"):
+        task = getattr(app.state, task_name, None)
+        if task and not task.done():
+            task.cancel()
+
+    # Batch turns still running save their threads before the connections close
+    if batch_tasks:
+        await asyncio.wait(batch_tasks, timeout=float(os.getenv("BATCH_SHUTDOWN_TIMEOUT", 30)))
+
+    # Flush queued messages to MongoDB before the connections close
+    if write_behind_queue is not None:
+        try:
+            await write_behind_queue.stop()
+        except Exception as e:
+            logger.error("Error flushing write-behind queue in AI-service: %s", e)
+
     try:
         await redis_client.close()
+        # The client does not own a pool it was given, disconnect it explicitly
+        await redis_client.connection_pool.disconnect()
     except Exception as e:
-        print(f"Error closing Redis connection in AI-service: {e}")
+        logger.warning("Error closing Redis connection in AI-service: %s", e)
 
+    try:
+        await mongo_client.close()
+    except Exception as e:
+        logger.warning("Error closing MongoDB connection in AI-service: %s", e)
 
-@app.post("/chat")
+    try:
+        await travelAgent.retriever.close()
+    except Exception as e:
+        logger.warning("Error closing retriever in AI-service: %s", e)
+
+    try:
+        await travelAgent.chat_completion_service.client.close()
+    except Exception as e:
+        logger.warning("Error closing Azure OpenAI client in AI-service: %s", e)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus metrics of all workers: per-stage latency histograms, plugin latency, cache and pool usage"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.post("/chat")
 async def chat(userMessage: Message):
     try:
-        user_input = userMessage.message.strip()
-        session_id = userMessage.session_id
+        reply = await run_chat(userMessage.session_id, userMessage.message.strip())
+        # Return to frontend for chat display
+        return {"reply": reply}
 
-        # Load thread
-        thread = await load_thread(session_id)
-        print(f"Loaded thread with ID: {thread._id}")
-        
-        # Augment the prompt based on user input
-        augmented_prompt = await get_augmented_prompt(user_input)
-        
-        # Combine the augmented prompt with user input
-        combined_messages = f"Here is relevant information: {augmented_prompt}\n\nUser: {user_input}"
-        
-        # Get AI response
-        response = await agent.get_response(messages=combined_messages, thread=thread)
+    except Exception as e:
+        logger.exception("Error in chat endpoint: %s", e)
+        return {"error": str(e)}
 
-        # Save thread 
-        await save_thread(session_id, thread)
-        print("Saved thread to database")
-        
-        # Debug: Display chat
-        print("------------------------------")
-        print(f"Thread ID: {thread._id}")
-        print(f"Total messages in thread: {len(thread)}")
-        print("Recent messages:")
+
+@router.post("/chat/stream")
+async def chat_stream(userMessage: Message):
+    """
+    Streaming variant of /chat using Server-Sent Events.
+    Each token is sent as `data: {"token": "..."}` as soon as the model produces it,
+    the thread is saved once the agent's stream is exhausted and `data: {"done": true}` closes the stream
+    """
+    user_input = userMessage.message.strip()
+    session_id = userMessage.session_id
+
+    async def event_stream():
         try:
-            message_count = 0
-            async for msg in thread.get_messages():
-                message_count += 1
-                if message_count > len(thread) - 3:  # Show last 3 messages
-                    print(f"  {message_count}. [Role: {msg.role.name}] Content: {msg.content[:100]}...")
+            # Requests of the same session run in order, the lock is held until the thread is saved
+            async with session_lock.hold(session_id):
+                routed = await answer_routed(session_id, user_input)
+                if routed is not None:
+                    thread, msg_count, history_len, reply = routed
+                    yield f"data: {json.dumps({'token': reply})}\n\n"
+                else:
+                    # Load thread and retrieval context, then build the agent message
+                    thread, msg_count, retrieval_context, combined_messages = await prepare_chat(session_id, user_input)
+                    history_len = len(thread)
+
+                    reply = await get_cached_reply(user_input, retrieval_context, thread)
+                    if reply is not None:
+                        await add_reply_to_thread(thread, combined_messages, reply)
+                        yield f"data: {json.dumps({'token': reply})}\n\n"
+                    else:
+                        # Stream AI response, the agent adds the full reply to the thread when the stream ends
+                        tokens = []
+                        async with stage_timer("agent"):
+                            async for chunk in travelAgent.agent.invoke_stream(messages=combined_messages, thread=thread):
+                                token = chunk.message.content
+                                if token:
+                                    tokens.append(token)
+                                    yield f"data: {json.dumps({'token': token})}\n\n"
+                        await cache_reply(user_input, retrieval_context, thread, history_len, "".join(tokens))
+
+                # Save thread
+                async with stage_timer("save_thread"):
+                    await save_thread(session_id, thread, history_len, msg_count)
+
+            log_chat_turn(thread, history_len)
+
+            yield f"data: {json.dumps({'done': True})}\n\n"
+
         except Exception as e:
-            print(f"Error while logging messages: {str(e)}")
-            
-        # Return to frontend for chat display
-        return {"reply": response.message.content}
+            logger.exception("Error in chat stream endpoint: %s", e)
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
 
-    except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
-        import traceback
-        print("Full traceback:")
-        print(traceback.format_exc())
-        return {"error": str(e)}
\ No newline at end of file
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering so tokens are flushed immediately
+        }
+    )
+
+
+@router.post("/chat/batch")
+async def chat_batch(batch: BatchRequest):
+    """
+    Many chat turns in one request, e.g. evaluation runs or bulk itineraries.
+    Replies are streamed as NDJSON in completion order, each line carries the item's index in the request
+    """
+    if len(batch.items) > batch_max_items:
+        return JSONResponse({"error": f"Batch has {len(batch.items)} items, the limit is {batch_max_items}"}, status_code=413)
+
+    return StreamingResponse(
+        run_batch(batch.items),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/threads/{session_id}/messages")
+async def thread_messages(
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=0),
+    order: Literal["desc", "asc"] = "desc",
+    roles: str = "USER,ASSISTANT",
+    stream: bool = False
+):
+    """
+    Saved messages of a session, newest first by default, for scrolling back through long conversations.
+    Pages: {"messages": [...], "next_cursor": ...}, pass next_cursor back as cursor for the next page.
+    stream=true sends NDJSON lines read lazily from one MongoDB cursor, limit=0 streams the whole thread.
+    Reads MongoDB, with PERSISTENCE_MODE=write_behind the latest turns appear once the queue has flushed them
+    """
+    if not stream and not 1 <= limit <= history_max_page:
+        return JSONResponse({"error": f"limit must be between 1 and {history_max_page}"}, status_code=400)
+
+    thread_info = await get_cached_thread_info(session_id)
+    if not thread_info:
+        thread_info = await thread_loads.do(f"thread_info:{session_id}", lambda: fetch_thread_info(session_id))
+        if not thread_info:
+            return JSONResponse({"error": f"No thread for session {session_id}"}, status_code=404)
+
+    thread_id = thread_info["thread_id"]
+    role_list = [role.strip().upper() for role in roles.split(",") if role.strip()]
+    newest_first = order == "desc"
+
+    try:
+        if stream:
+            lines = stream_messages(msg_collection, thread_id, role_list, cursor, limit, newest_first, history_batch_size)
+            # Decode the cursor before the response starts, a bad one is still a 400
+            first_line = await anext(lines, None)
+            return StreamingResponse(
+                prepend(first_line, lines),
+                media_type="application/x-ndjson",
+                headers={"X-Accel-Buffering": "no"}
+            )
+
+        return await read_page(msg_collection, thread_id, role_list, cursor, limit, newest_first)
+
+    except InvalidCursor as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+
+async def prepend(first_line: Optional[str], lines):
+    try:
+        if first_line is None:
+            return
+        yield first_line
+        async for line in lines:
+            yield line
+    finally:
+        await lines.aclose()
+
+
+# -------------------------------------------------------------App Factory------------------------------------------------------------
+def create_app() -> FastAPI:
+    """
+    Build the application. Nothing connects here, clients are created by the lifespan in each worker,
+    so the module can be imported (or preloaded by gunicorn) before the workers fork
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"], # Replace * later with specific domain name
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"]
+    )
+    app.middleware("http")(server_timing_middleware)
+    app.middleware("http")(request_context_middleware)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,156 @@
+# -------------------------------------------------------------In-memory Stand-ins------------------------------------------------------------
+# Just enough of redis.asyncio and PyMongo's async API for the persistence and cache hot paths,
+# so benchmarks measure our code without network round-trips.
+
+import copy
+
+
+# -------------------------------------------------------------Redis------------------------------------------------------------
+
+def _encode(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+
+class FakeRedis:
+    """Strings and lists only, values come back as bytes like a client with decode_responses=False"""
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def getex(self, key, ex=None):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = _encode(value)
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def expire(self, key, seconds):
+        return key in self.data
+
+    async def lrange(self, key, start, end):
+        values = self.data.get(key, [])
+        end = len(values) if end == -1 else end + 1
+        return values[start:end] if start >= 0 else values[max(len(values) + start, 0):end]
+
+    async def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(_encode(value) for value in values)
+        return len(self.data[key])
+
+    async def rpushx(self, key, *values):
+        if key not in self.data:
+            return 0
+        return await self.rpush(key, *values)
+
+    async def ltrim(self, key, start, end):
+        if key in self.data:
+            self.data[key] = await self.lrange(key, start, end)
+        return True
+
+    async def flushall(self):
+        self.data.clear()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = [await command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+# -------------------------------------------------------------MongoDB------------------------------------------------------------
+
+def _matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if isinstance(condition, dict) and "$in" in condition:
+            if doc.get(field) not in condition["$in"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return copy.copy(doc)
+    included = {field for field, flag in projection.items() if flag}
+    include_id = projection.get("_id", 1)
+    return {field: value for field, value in doc.items() if field in included or (field == "_id" and include_id)}
+
+
+class FakeCursor:
+    def __init__(self, docs: list):
+        self.docs = docs
+
+    def sort(self, field, direction=1):
+        self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else self.docs
+
+
+class FakeCollection:
+    """Documents are kept per thread_id/session_id the way an index would narrow a real query"""
+    def __init__(self, key_field: str):
+        self.key_field = key_field
+        self.docs = {}
+
+    def _candidates(self, query: dict) -> list:
+        if self.key_field in query:
+            return self.docs.get(query[self.key_field], [])
+        return [doc for docs in self.docs.values() for doc in docs]
+
+    async def find_one(self, query: dict, projection=None):
+        for doc in self._candidates(query):
+            if _matches(doc, query):
+                return _project(doc, projection)
+        return None
+
+    def find(self, query: dict, projection=None):
+        return FakeCursor([_project(doc, projection) for doc in self._candidates(query) if _matches(doc, query)])
+
+    async def insert_many(self, docs: list, ordered=True):
+        for doc in docs:
+            self.docs.setdefault(doc[self.key_field], []).append(dict(doc))
+
+    async def update_one(self, query: dict, update: dict, upsert=False):
+        for doc in self._candidates(query):
+            if _matches(doc, query):
+                doc.update(update.get("$set", {}))
+                return
+        if upsert:
+            doc = {**query, **update.get("$set", {}), **update.get("$setOnInsert", {})}
+            self.docs.setdefault(doc[self.key_field], []).append(doc)
+
+    def clear(self):
+        self.docs.clear()
@@ -0,0 +1,426 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Microbenchmarks for the persistence and cache hot paths of api_server, run against in-memory Redis/MongoDB
+# stand-ins and a stubbed agent. From ai-service/:
+#
+#   python benchmarks/run_benchmarks.py                        print timings (and compare with --baseline when it exists)
+#   python benchmarks/run_benchmarks.py --reference HEAD       compare with the code at a git ref, measured in the same run
+#   python benchmarks/run_benchmarks.py --update-baseline      record a local baseline (git ignored, machine specific)
+#
+# With --reference every benchmark and size is measured --repeats times on both trees, alternating between a
+# worker process per tree (fresh ones every repeat), so drift of a shared host hits both sides alike: back-to-back
+# runs of the same code differ by up to 2x there. The median over the repeats of each side is compared.
+# Exits with status 1 when a benchmark is slower than the reference by more than the tolerance.
+
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess
+
+from datetime import datetime, UTC
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+# The ai-service tree under test, another checkout when measuring a --reference
+CODE_DIR = os.getenv("BENCHMARK_CODE_DIR", os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, CODE_DIR)
+
+# api_server reads its configuration at import time, point everything at local stand-ins
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://benchmark.openai.azure.com")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-06-01")
+os.environ.setdefault("RETRIEVER", "bm25")
+os.environ.setdefault("BM25_INDEX_PATH", os.path.join(tempfile.gettempdir(), "benchmark_bm25_index.npz"))
+
+import api_server  # noqa: E402
+from fakes import FakeRedis, FakeCollection  # noqa: E402
+from semantic_kernel.contents import ChatMessageContent  # noqa: E402
+from semantic_kernel.contents.utils.author_role import AuthorRole  # noqa: E402
+
+
+DEFAULT_SIZES = [1, 10, 100, 1000, 10000]
+
+
+# -------------------------------------------------------------Fixtures------------------------------------------------------------
+
+redis_client = FakeRedis()
+threads_collection = FakeCollection("session_id")
+msg_collection = FakeCollection("thread_id")
+
+api_server.redis_client = redis_client
+api_server.threads_collection = threads_collection
+api_server.msg_collection = msg_collection
+
+
+def make_cached_messages(count: int) -> list:
+    return [
+        {
+            "role": "USER" if i % 2 == 0 else "ASSISTANT",
+            "content": f"Message {i}: what is the weather like in Barcelona during the first week of June?",
+            "timestamp": datetime.now(UTC).isoformat()
+        }
+        for i in range(count)
+    ]
+
+
+def make_chat_messages(count: int) -> list:
+    return [
+        ChatMessageContent(
+            role=AuthorRole.USER if i % 2 == 0 else AuthorRole.ASSISTANT,
+            content=f"Message {i}: what is the weather like in Barcelona during the first week of June?"
+        )
+        for i in range(count)
+    ]
+
+
+async def seed_thread(session_id: str, count: int) -> str:
+    """Store a thread with count messages in the fake database, leaving the cache cold"""
+    thread_id = f"thread_{session_id}"
+    await threads_collection.update_one(
+        {"session_id": session_id},
+        {"$set": {"msg_count": count}, "$setOnInsert": {"thread_id": thread_id}},
+        upsert=True
+    )
+    docs = api_server.serialize_messages(thread_id, make_chat_messages(count))
+    await msg_collection.insert_many(docs)
+    return thread_id
+
+
+class StubAgent:
+    """Stands in for the ChatCompletionAgent: adds the user message and a canned reply to the thread"""
+    async def get_response(self, messages, thread):
+        await thread.on_new_message(ChatMessageContent(role=AuthorRole.USER, content=messages))
+        await thread.on_new_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content="Barcelona is sunny in June."))
+
+
+def reset():
+    redis_client.data.clear()
+    threads_collection.clear()
+    msg_collection.clear()
+
+
+# -------------------------------------------------------------Benchmarks------------------------------------------------------------
+# Each benchmark takes a size and returns (setup, run): setup prepares state outside the timed region
+
+def bench_cache_messages(size):
+    messages = make_cached_messages(size)
+
+    async def run():
+        await api_server.cache_messages("thread_bench", messages)
+    return None, run
+
+
+def bench_get_cached_messages(size):
+    async def setup():
+        reset()
+        await redis_client.rpush("thread_msg:thread_bench", *[api_server.cache_codec.encode(msg) for msg in make_cached_messages(size)])
+
+    async def run():
+        await api_server.get_cached_messages("thread_bench")
+    return setup, run
+
+
+def bench_serialize_messages(size):
+    messages = make_chat_messages(size)
+
+    async def run():
+        api_server.serialize_messages("thread_bench", messages)
+    return None, run
+
+
+def bench_build_chat_history(size):
+    messages = make_cached_messages(size)
+
+    async def run():
+        api_server.build_chat_history("", messages)
+    return None, run
+
+
+def bench_load_thread_cold(size):
+    """Cache miss: thread info and window come from the database and are written back to the cache"""
+    async def setup():
+        reset()
+        await seed_thread("session_bench", size)
+
+    async def run():
+        await api_server.load_thread("session_bench")
+    return setup, run
+
+
+def bench_load_thread_warm(size):
+    async def setup():
+        reset()
+        await seed_thread("session_bench", size)
+        await api_server.load_thread("session_bench")
+
+    async def run():
+        await api_server.load_thread("session_bench")
+    return setup, run
+
+
+def bench_save_thread(size):
+    """Persist a turn that produced size new messages"""
+    state = {}
+
+    async def setup():
+        reset()
+        thread, msg_count = await api_server.load_thread("session_bench")
+        for message in make_chat_messages(size):
+            await thread.on_new_message(message)
+        state.update(thread=thread, msg_count=msg_count)
+
+    async def run():
+        await api_server.save_thread("session_bench", state["thread"], 0, state["msg_count"])
+    return setup, run
+
+
+def bench_chat_turn(size):
+    """load_thread -> stubbed agent -> save_thread on a thread with size messages of history"""
+    agent = StubAgent()
+
+    async def setup():
+        reset()
+        await seed_thread("session_bench", size)
+        await api_server.load_thread("session_bench")
+
+    async def run():
+        thread, msg_count = await api_server.load_thread("session_bench")
+        history_len = len(thread)
+        await agent.get_response(messages="Is Barcelona available in June?", thread=thread)
+        await api_server.save_thread("session_bench", thread, history_len, msg_count)
+    return setup, run
+
+
+BENCHMARKS = {
+    "cache_messages": bench_cache_messages,
+    "get_cached_messages": bench_get_cached_messages,
+    "serialize_messages": bench_serialize_messages,
+    "build_chat_history": bench_build_chat_history,
+    "load_thread_cold": bench_load_thread_cold,
+    "load_thread_warm": bench_load_thread_warm,
+    "save_thread": bench_save_thread,
+    "chat_turn": bench_chat_turn,
+}
+
+
+# -------------------------------------------------------------Runner------------------------------------------------------------
+
+async def settle(timeout: float = 1.0):
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    if pending:
+        await asyncio.wait(pending, timeout=timeout)
+
+
+async def measure(benchmark, size: int, min_time: float, max_rounds: int) -> float:
+    """Median microseconds per call, setup runs before every round.
+    Like timeit, the garbage collector is off while timing and background tasks of the previous round
+    (cache writes, summary refreshes) get to finish first so they do not land in the next sample"""
+    setup, run = benchmark(size)
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_rounds and (len(samples) < 5 or time.perf_counter() - started < min_time):
+        if setup:
+            await setup()
+        await settle()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            await run()
+            samples.append((time.perf_counter() - start) * 1e6)
+        finally:
+            gc.enable()
+    return statistics.median(samples)
+
+
+async def run_all(names: list, sizes: list, min_time: float, max_rounds: int) -> dict:
+    results = {}
+    for name in names:
+        results[name] = {}
+        for size in sizes:
+            median_us = await measure(BENCHMARKS[name], size, min_time, max_rounds)
+            results[name][str(size)] = round(median_us, 2)
+            print(f"{name:<22} size={size:<6} {median_us:>12.1f} us")
+    return results
+
+
+async def serve(min_time: float, max_rounds: int):
+    """Worker mode for --reference: measure one "name size" per stdin line, answer with one JSON line"""
+    # The service logs to stdout, keep the pipe to the parent for the answers and send everything else to stderr
+    answers = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    while True:
+        line = await asyncio.to_thread(sys.stdin.readline)
+        if not line:
+            return
+        name, size = line.split()
+        try:
+            result = {"median_us": round(await measure(BENCHMARKS[name], int(size), min_time, max_rounds), 2)}
+        except Exception as e:
+            # An older reference tree may not have everything a benchmark calls
+            result = {"error": repr(e)}
+        print(json.dumps(result), file=answers, flush=True)
+
+
+class Worker:
+    """A --serve process benchmarking the ai-service tree in code_dir"""
+    def __init__(self, code_dir: str, min_time: float, max_rounds: int):
+        command = [
+            sys.executable, os.path.abspath(__file__), "--serve",
+            "--min-time", str(min_time), "--max-rounds", str(max_rounds)
+        ]
+        self.process = subprocess.Popen(
+            command, cwd=code_dir, env={**os.environ, "BENCHMARK_CODE_DIR": code_dir},
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+
+    def measure(self, name: str, size: int) -> dict:
+        self.process.stdin.write(f"{name} {size}\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Benchmark worker exited with status {self.process.wait()}, see its output above")
+        return json.loads(line)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def run_against_reference(args) -> tuple[dict, dict]:
+    """Benchmark this tree and a worktree of args.reference, alternating between them on every measurement.
+    A shared host drifts over seconds and some processes run slower than others throughout, so every repeat
+    starts a fresh pair of workers and only neighbouring measurements are compared"""
+    repo_root = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    service_path = os.path.relpath(os.path.dirname(BENCHMARK_DIR), repo_root)
+
+    medians = {"current": {}, "reference": {}}
+    failed = set()
+    with tempfile.TemporaryDirectory() as work_dir:
+        worktree = os.path.join(work_dir, "reference")
+        subprocess.run(["git", "worktree", "add", "--quiet", "--detach", worktree, args.reference], cwd=repo_root, check=True)
+        trees = {"current": os.path.dirname(BENCHMARK_DIR), "reference": os.path.join(worktree, service_path)}
+        try:
+            for repeat in range(args.repeats):
+                print(f"--- repeat {repeat + 1}/{args.repeats}")
+                order = ["reference", "current"] if repeat % 2 == 0 else ["current", "reference"]
+                workers = {label: Worker(trees[label], args.min_time, args.max_rounds) for label in order}
+                try:
+                    for name in args.benchmarks:
+                        for size in args.sizes:
+                            if (name, size) in failed:
+                                continue
+                            for label in order:
+                                result = workers[label].measure(name, size)
+                                if "error" in result:
+                                    print(f"{name:<22} size={size:<6} failed on {label}: {result['error']}")
+                                    failed.add((name, size))
+                                    break
+                                medians[label].setdefault((name, size), []).append(result["median_us"])
+                finally:
+                    for worker in workers.values():
+                        worker.close()
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=repo_root)
+
+    # A single fast or slow worker moves the min or the mean of a side, not its median
+    results = {"current": {}, "reference": {}}
+    for name in args.benchmarks:
+        for size in args.sizes:
+            if (name, size) in failed:
+                continue
+            for label in results:
+                results[label].setdefault(name, {})[str(size)] = statistics.median(medians[label][(name, size)])
+            print(
+                f"{name:<22} size={size:<6} {results['reference'][name][str(size)]:>12.1f} us"
+                f" -> {results['current'][name][str(size)]:>12.1f} us"
+            )
+    return results["current"], results["reference"]
+
+
+def compare(results: dict, baseline: dict, tolerance: float, noise_floor_us: float) -> list:
+    """Benchmarks slower than baseline * (1 + tolerance), ignoring differences below the noise floor"""
+    regressions = []
+    for name, by_size in results.items():
+        for size, current in by_size.items():
+            previous = baseline.get(name, {}).get(size)
+            if previous is None:
+                continue
+            if current > previous * (1 + tolerance) and current - previous > noise_floor_us:
+                regressions.append(f"{name} size={size}: {previous:.1f} us -> {current:.1f} us")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ai-service persistence and cache hot paths")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent per benchmark and size")
+    parser.add_argument("--max-rounds", type=int, default=5000)
+    parser.add_argument("--reference", help="git ref to compare with, benchmarked in the same run")
+    parser.add_argument("--repeats", type=int, default=5, help="alternating measurements per side with --reference")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--baseline", default=os.path.join(BENCHMARK_DIR, "baseline.json"))
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "results.json"))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--noise-floor", type=float, default=5.0, help="ignore slowdowns below this many microseconds")
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.min_time, args.max_rounds))
+        return
+
+    if args.reference:
+        results, reference = run_against_reference(args)
+        against = f"reference {args.reference}"
+    else:
+        results = asyncio.run(run_all(args.benchmarks, args.sizes, args.min_time, args.max_rounds))
+        reference = None
+        against = "baseline"
+
+    report = {
+        "meta": {
+            "created": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "unit": "median microseconds per call"
+        },
+        "results": results
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if reference is None:
+        if not args.baseline or not os.path.exists(args.baseline):
+            return
+        with open(args.baseline) as f:
+            reference = json.load(f)["results"]
+
+    regressions = compare(results, reference, args.tolerance, args.noise_floor)
+    if regressions:
+        print(f"Regressions against {against}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions against {against}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Versioned binary encoding for cached thread data (thread info, message window, summary).
+#
+#   CACHE_CODEC               msgpack (default) or json. json writes the legacy format, useful while older
+#                             workers that only read JSON are still running
+#   CACHE_COMPRESS_MIN_BYTES  payloads at least this large are zstd compressed (default 1024)
+
+import os
+import json
+import logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Cache Codec------------------------------------------------------------
+
+""" Encoded value structure
+b"\xc1" + version byte + body
+    version 1: msgpack
+    version 2: zstd compressed msgpack
+anything else is a legacy JSON entry (UTF-8 text)
+0xc1 is never used by msgpack and never starts a JSON document, so the formats cannot be confused
+"""
+
+MAGIC = b"\xc1"
+VERSION_MSGPACK = 1
+VERSION_MSGPACK_ZSTD = 2
+
+
+class CacheCodec:
+    def __init__(self, codec: str = "msgpack", compress_min_bytes: int = 1024, compression_level: int = 3):
+        if codec == "msgpack" and msgpack is None:
+            logger.warning("msgpack is not installed, caching as JSON")
+            codec = "json"
+        self.codec = codec
+        self.compress_min_bytes = compress_min_bytes
+        self._compressor = zstandard.ZstdCompressor(level=compression_level) if zstandard else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def encode(self, value) -> bytes:
+        if self.codec == "json":
+            return json.dumps(value).encode("utf-8")
+
+        body = msgpack.packb(value, use_bin_type=True)
+        if self._compressor is not None and len(body) >= self.compress_min_bytes:
+            return MAGIC + bytes([VERSION_MSGPACK_ZSTD]) + self._compressor.compress(body)
+        return MAGIC + bytes([VERSION_MSGPACK]) + body
+
+    def decode(self, raw: bytes):
+        """Decode any version this worker knows, including legacy JSON entries"""
+        if not raw.startswith(MAGIC):
+            return json.loads(raw)
+
+        version, body = raw[1], raw[2:]
+        if version == VERSION_MSGPACK_ZSTD:
+            if self._decompressor is None:
+                raise ValueError("Cache entry is zstd compressed but zstandard is not installed")
+            body = self._decompressor.decompress(body)
+        elif version != VERSION_MSGPACK:
+            raise ValueError(f"Unknown cache entry version {version}")
+
+        if msgpack is None:
+            raise ValueError("Cache entry is msgpack encoded but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+
+
+def create_cache_codec() -> CacheCodec:
+    return CacheCodec(
+        codec=os.getenv("CACHE_CODEC", "msgpack").lower(),
+        compress_min_bytes=int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 1024))
+    )
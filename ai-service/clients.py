@@ -0,0 +1,188 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Central configuration of the network clients: pool sizes, keep-alive, timeouts and HTTP/2.
+# Every client keeps warm connections so requests do not pay for TCP and TLS handshakes.
+#
+#   MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE     connections per MongoDB server (default 50 / 5)
+#   MONGO_MAX_IDLE_MS                             idle connections are closed after this (default 300000)
+#   MONGO_CONNECT_TIMEOUT_MS                      connect and server selection timeout (default 5000)
+#   REDIS_MAX_CONNECTIONS                         Redis pool size, requests wait for a free connection (default 50)
+#   REDIS_POOL_TIMEOUT                            seconds to wait for a free Redis connection (default 5)
+#   REDIS_SOCKET_TIMEOUT                          seconds per Redis command (default 10)
+#   OPENAI_MAX_CONNECTIONS / OPENAI_MAX_KEEPALIVE Azure OpenAI pool size and warm connections (default 100 / 20)
+#   OPENAI_TIMEOUT / OPENAI_MAX_RETRIES           completion timeout in seconds and SDK retries (default 60 / 2)
+#   SEARCH_MAX_CONNECTIONS                        Azure AI Search pool size (default 50)
+#   HTTP_KEEPALIVE_SECONDS                        idle HTTP connections are kept this long (default 60)
+#   HTTP2_ENABLED                                 HTTP/2 to Azure OpenAI when h2 is installed (default true)
+
+import os
+
+import aiohttp
+import certifi
+import httpx
+import redis.asyncio as redis
+
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+from pymongo import AsyncMongoClient
+from pymongo.monitoring import ConnectionPoolListener
+from azure.core.pipeline.transport import AioHttpTransport
+
+from metrics import pool_stats
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def http_keepalive() -> float:
+    return float(os.getenv("HTTP_KEEPALIVE_SECONDS", 60))
+
+
+# -------------------------------------------------------------MongoDB------------------------------------------------------------
+
+class MongoPoolListener(ConnectionPoolListener):
+    """Counts open and checked out connections across every server the client talks to"""
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_closed(self, event):
+        self.open -= 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+
+def create_mongo_client(mongo_uri: str) -> AsyncMongoClient:
+    max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+    connect_timeout_ms = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+    listener = MongoPoolListener()
+
+    client = AsyncMongoClient(
+        mongo_uri,
+        tlsCAFile=certifi.where(),
+        maxPoolSize=max_pool_size,
+        minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", 5)),
+        maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_MS", 300000)),
+        connectTimeoutMS=connect_timeout_ms,
+        serverSelectionTimeoutMS=connect_timeout_ms,
+        event_listeners=[listener]
+    )
+
+    pool_stats["mongo"] = lambda: {
+        "in_use": listener.checked_out,
+        "idle": listener.open - listener.checked_out,
+        "max": max_pool_size
+    }
+    return client
+
+
+# -------------------------------------------------------------Redis------------------------------------------------------------
+
+def create_redis_client() -> redis.Redis:
+    # A blocking pool makes bursts wait for a free connection instead of failing with "Too many connections"
+    pool = redis.BlockingConnectionPool(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        db=0,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+        timeout=float(os.getenv("REDIS_POOL_TIMEOUT", 5)),
+        socket_connect_timeout=5,
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 10)),
+        socket_keepalive=True,
+        health_check_interval=30,
+    )
+
+    pool_stats["redis"] = lambda: {
+        "in_use": len(getattr(pool, "_in_use_connections", ())),
+        "idle": len(getattr(pool, "_available_connections", ())),
+        "max": pool.max_connections
+    }
+    return redis.Redis(connection_pool=pool, decode_responses=False)
+
+
+# -------------------------------------------------------------Azure OpenAI------------------------------------------------------------
+
+def create_openai_client() -> AsyncAzureOpenAI:
+    """Azure OpenAI client with its own tuned HTTP pool, HTTP/2 multiplexes concurrent completions on few connections"""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=http_keepalive()
+    )
+    timeout = float(os.getenv("OPENAI_TIMEOUT", 60))
+    http_client = DefaultAsyncHttpxClient(
+        limits=limits,
+        timeout=httpx.Timeout(timeout, connect=5.0),
+        http2=HTTP2_AVAILABLE and os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    )
+
+    def httpx_pool_stats():
+        connections = list(getattr(getattr(http_client._transport, "_pool", None), "_connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"in_use": len(connections) - idle, "idle": idle, "max": limits.max_connections}
+
+    pool_stats["azure_openai"] = httpx_pool_stats
+
+    return AsyncAzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", 2)),
+        http_client=http_client
+    )
+
+
+# -------------------------------------------------------------Azure AI Search------------------------------------------------------------
+
+def create_search_transport() -> AioHttpTransport:
+    """
+    Shared aiohttp transport for Azure AI Search clients, must be created inside the running event loop.
+    The caller owns the session and closes it with close_search_transport
+    """
+    connector = aiohttp.TCPConnector(
+        limit=int(os.getenv("SEARCH_MAX_CONNECTIONS", 50)),
+        keepalive_timeout=http_keepalive(),
+        ttl_dns_cache=300
+    )
+    session = aiohttp.ClientSession(connector=connector, auto_decompress=False, cookie_jar=aiohttp.DummyCookieJar())
+
+    pool_stats["azure_search"] = lambda: {
+        "in_use": len(getattr(connector, "_acquired", ())),
+        "idle": sum(len(connections) for connections in getattr(connector, "_conns", {}).values()),
+        "max": connector.limit
+    }
+    return AioHttpTransport(session=session, session_owner=False)
+
+
+async def close_search_transport(transport: AioHttpTransport):
+    if transport is not None and transport.session is not None:
+        await transport.session.close()
@@ -0,0 +1,159 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Token-budgeted chat history: load_thread keeps the newest messages that fit the budget and
+# every older turn, whether it fell out of the budget or out of the cached window, is folded into a rolling summary.
+
+import logging
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, UTC
+from typing import List, Optional, Tuple
+
+from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.connectors.ai.open_ai import AzureChatPromptExecutionSettings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Token Counting------------------------------------------------------------
+
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def load_tokenizer():
+    """Load the gpt-4o tokenizer, called from the lifespan so no request pays for reading (or downloading) it"""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return
+    _encoding_loaded = True
+    if tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning("Tokenizer unavailable, estimating token counts: %s", e)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the gpt-4o tokenizer, estimating 4 characters per token when it is unavailable"""
+    if not text:
+        return 0
+
+    if not _encoding_loaded:
+        load_tokenizer()
+
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def fit_to_budget(messages: List[dict], budget: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Split messages (oldest -> newest) into the ones dropped and the newest ones that fit the token budget.
+    The newest message is always kept
+    """
+    used = 0
+    start = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        used += count_tokens(messages[i]["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if used > budget and i < len(messages) - 1:
+            break
+        start = i
+
+    return messages[start:], messages[:start]
+
+
+# -------------------------------------------------------------Rolling Summary------------------------------------------------------------
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a user and a travel agent.
+    Merge the new messages into the current summary. Keep destinations, dates, budgets, preferences,
+    bookings and open questions. Drop greetings and small talk. Answer with the updated summary only, in under 200 words.
+"""
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Cached timestamps are ISO strings, naive ones come from MongoDB and are UTC"""
+    if not value:
+        return None
+    timestamp = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=UTC)
+
+
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def to_millis(value) -> Optional[datetime]:
+    """MongoDB stores milliseconds while cached timestamps carry microseconds, timestamps are compared at milliseconds"""
+    timestamp = parse_timestamp(value)
+    if timestamp is None:
+        return None
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+
+def unsummarized(messages: List[dict], summary_until) -> List[dict]:
+    """Messages newer than the last one folded into the summary"""
+    cutoff = to_millis(summary_until)
+    if cutoff is None:
+        return messages
+    return [msg for msg in messages if to_millis(msg["timestamp"]) > cutoff]
+
+
+@dataclass
+class SummaryPlan:
+    # Window messages to fold, oldest first
+    messages: List[dict]
+    # Messages that already left the cached window are read from the database: after summary_until, before this
+    read_before: Optional[datetime]
+    # The new summary covers every message up to and including this timestamp
+    summary_until: datetime
+
+
+def plan_summary(window: List[dict], kept: List[dict], summary_until, window_full: bool) -> Optional[SummaryPlan]:
+    """
+    Everything older than the first kept message belongs in the summary. window is the cached window
+    (oldest -> newest, user and assistant messages), kept its tail that fits the token budget.
+    Messages sharing the first kept message's millisecond wait until that one is folded too, so none is lost or folded twice.
+    None when the summary is up to date
+    """
+    if not kept:
+        return None
+
+    boundary = to_millis(kept[0]["timestamp"])
+    cutoff = to_millis(summary_until)
+    new_until = boundary - MILLISECOND
+    if cutoff is not None and cutoff >= new_until:
+        return None
+
+    dropped = window[:len(window) - len(kept)]
+    messages = [msg for msg in unsummarized(dropped, cutoff) if to_millis(msg["timestamp"]) < boundary]
+
+    # A full window may have lost older messages to trimming, fold whatever the summary does not cover yet
+    window_start = to_millis(window[0]["timestamp"])
+    read_before = window[0]["timestamp"] if window_full and (cutoff is None or cutoff < window_start - MILLISECOND) else None
+
+    if not messages and read_before is None:
+        return None
+    return SummaryPlan(messages=messages, read_before=parse_timestamp(read_before), summary_until=new_until)
+
+
+async def summarize_messages(chat_service, previous_summary: str, messages: List[dict]) -> str:
+    """Fold messages into the previous summary with one completion call"""
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+
+    history = ChatHistory()
+    history.add_system_message(SUMMARY_INSTRUCTIONS)
+    history.add_user_message(
+        f"Current summary:\n{previous_summary or '(empty)'}\n\nNew messages:\n{transcript}"
+    )
+
+    settings = AzureChatPromptExecutionSettings(max_tokens=400, temperature=0.2)
+    response = await chat_service.get_chat_message_content(chat_history=history, settings=settings)
+    return (response.content or "").strip() if response else previous_summary
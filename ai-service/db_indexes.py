@@ -0,0 +1,96 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# MongoDB indexes behind the hot read path, created by every worker on startup (a no-op once they exist).
+#
+#   MONGO_ENSURE_INDEXES   create the indexes on startup (default true), turn off where indexes are managed elsewhere
+#   MONGO_EXPLAIN_CHECK    explain the hot queries on startup and warn when they scan or sort in memory (default true)
+
+import logging
+import os
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Indexes------------------------------------------------------------
+
+# load_thread reads one Threads document by session_id, saves upsert on it.
+# Unique so concurrent first requests of a session cannot create two threads
+THREAD_INDEXES = [
+    IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique")
+]
+
+# Latest messages of a thread: equality on thread_id, $in on role, sorted by timestamp.
+# Each role is one index range read in timestamp order, merged without an in-memory sort
+MESSAGE_INDEXES = [
+    IndexModel([("thread_id", ASCENDING), ("role", ASCENDING), ("timestamp", DESCENDING)], name="thread_role_timestamp"),
+    # History pages continue from a (timestamp, _id) position, see thread_history.py
+    IndexModel([("thread_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="thread_timestamp_id")
+]
+
+# Fields of a message the read path uses, items (tool calls and results) can be large and are never read back
+MESSAGE_PROJECTION = {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+THREAD_INFO_PROJECTION = {"_id": 0, "thread_id": 1, "msg_count": 1}
+
+
+def latest_messages_query(thread_id: str) -> dict:
+    return {
+        "thread_id": thread_id,
+        "role": {"$in": ["USER", "ASSISTANT"]}  # Only load user and assistant messages
+    }
+
+
+async def ensure_indexes(threads_collection, msg_collection):
+    """Create missing indexes, a failure (e.g. duplicate session_ids) is logged and never stops the service"""
+    if os.getenv("MONGO_ENSURE_INDEXES", "true").lower() != "true":
+        return
+
+    for collection, indexes in ((threads_collection, THREAD_INDEXES), (msg_collection, MESSAGE_INDEXES)):
+        try:
+            names = await collection.create_indexes(indexes)
+            logger.info("Indexes ready on %s: %s", collection.name, ", ".join(names))
+        except OperationFailure as e:
+            logger.error("Failed to create indexes on %s: %s", collection.name, e)
+
+
+# -------------------------------------------------------------Explain Checks------------------------------------------------------------
+
+def plan_stages(plan) -> set:
+    """Every stage name in an explain plan, whatever the server version nests them under"""
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= plan_stages(value)
+    return stages
+
+
+async def check_query_plans(threads_collection, msg_collection):
+    """Warn when a hot query would scan the collection or sort in memory, the plan is the same for any thread"""
+    if os.getenv("MONGO_EXPLAIN_CHECK", "true").lower() != "true":
+        return
+
+    queries = {
+        "thread_info": threads_collection.find({"session_id": ""}, THREAD_INFO_PROJECTION).limit(1),
+        "latest_messages": msg_collection.find(latest_messages_query(""), MESSAGE_PROJECTION).sort("timestamp", DESCENDING).limit(50),
+        "history": msg_collection.find({"thread_id": ""}).sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(50)
+    }
+    for name, cursor in queries.items():
+        try:
+            explain = await cursor.explain()
+        except Exception as e:
+            logger.warning("Could not explain the %s query: %s", name, e)
+            continue
+
+        stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        problems = stages & {"COLLSCAN", "SORT"}
+        if problems:
+            logger.warning("The %s query uses %s, check the indexes in db_indexes.py", name, ", ".join(sorted(problems)))
+        else:
+            logger.info("The %s query plan uses stages %s", name, ", ".join(sorted(stages)))
@@ -0,0 +1,74 @@
+# -------------------------------------------------------------Gunicorn------------------------------------------------------------
+# N uvicorn workers per pod: gunicorn api_server:app -c gunicorn.conf.py
+# Each worker creates its own clients in the app lifespan after the fork.
+#
+#   WEB_CONCURRENCY            worker processes (default: the container's cgroup CPU limit rounded up, 2 without a limit)
+#   PROMETHEUS_MULTIPROC_DIR   shared directory for the workers' metric samples, emptied on startup
+
+import os
+import glob
+import math
+
+from prometheus_client import multiprocess
+
+# Without a CPU limit the node's cores say nothing about this pod's share, and every worker opens its own
+# MongoDB, Redis and OpenAI pools, so the default stays small
+DEFAULT_WORKERS = 2
+
+
+def cgroup_cpu_limit():
+    """CPUs allowed by the cgroup quota (v2 cpu.max, then v1 cfs files), None when unlimited or unknown"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def default_workers() -> int:
+    limit = cgroup_cpu_limit()
+    if limit is None:
+        return DEFAULT_WORKERS
+    return max(1, min(math.ceil(limit), len(os.sched_getaffinity(0))))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", default_workers()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Replies stream for as long as the model generates, shutdown waits for the write-behind flush
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Requests are logged by the app with their request ID
+accesslog = None
+
+
+def on_starting(server):
+    """Drop metric files of a previous run, their workers no longer exist"""
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """Stop counting a dead worker's live gauges"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,108 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Creates the travel-documents index and uploads the corpus only when the index does not already hold it.
+# Run it as a one-off step with `python index_bootstrap.py [--force]`, the API also runs it as a background task on startup.
+
+import logging
+import os
+import sys
+import asyncio
+
+from dotenv import load_dotenv
+
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ResourceNotFoundError
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from azure.search.documents.indexes.models import SearchIndex, SimpleField, SearchFieldDataType, SearchableField
+
+from retrieval_cache import get_documents_version
+
+
+load_dotenv()
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Index Schema & Documents------------------------------------------------------------
+
+index_name = "travel-documents"
+
+# Define the index schema -> A record
+fields = [
+    # Consist of an id and content
+    SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+    SearchableField(name="content", type=SearchFieldDataType.String),
+    # Content hash of the document set the record was uploaded with
+    SimpleField(name="corpus_version", type=SearchFieldDataType.String, filterable=True)
+]
+
+# A table(schema)
+index = SearchIndex(name=index_name, fields=fields)
+
+# Enhanced sample documents
+documents = [
+    {"id": "1", "content": "Contoso Travel offers luxury vacation packages to exotic destinations worldwide."},
+    {"id": "2", "content": "Our premium travel services include personalized itinerary planning and 24/7 concierge support."},
+    {"id": "3", "content": "Contoso's travel insurance covers medical emergencies, trip cancellations, and lost baggage."},
+    {"id": "4", "content": "Popular destinations include the Maldives, Swiss Alps, and African safaris."},
+    {"id": "5", "content": "Contoso Travel provides exclusive access to boutique hotels and private guided tours."}
+]
+
+corpus_version = get_documents_version(documents)
+
+
+# -------------------------------------------------------------Bootstrap------------------------------------------------------------
+
+async def bootstrap_index(force: bool = False) -> bool:
+    """
+    Make sure the index exists and holds the current corpus version.
+    Returns True when documents were uploaded, False when the index was already up to date
+    """
+    endpoint = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
+    credential = AzureKeyCredential(os.getenv("AZURE_SEARCH_API_KEY"))
+
+    async with SearchIndexClient(endpoint=endpoint, credential=credential) as index_client:
+        # Check if index already exists if not, create it
+        try:
+            existing_index = await index_client.get_index(index_name)
+            if "corpus_version" not in [field.name for field in existing_index.fields]:
+                logger.info("Adding corpus_version field to index '%s'...", index_name)
+                await index_client.create_or_update_index(index)
+        except ResourceNotFoundError:
+            logger.info("Creating new index '%s'...", index_name)
+            await index_client.create_index(index)
+
+    async with SearchClient(endpoint=endpoint, index_name=index_name, credential=credential) as search_client:
+        if not force:
+            results = await search_client.search(
+                search_text="*",
+                filter=f"corpus_version eq '{corpus_version}'",
+                include_total_count=True,
+                top=0
+            )
+            if await results.get_count() == len(documents):
+                logger.info("Index '%s' already holds corpus version %s, skipping upload.", index_name, corpus_version)
+                return False
+
+        logger.info("Uploading corpus version %s to index '%s'...", corpus_version, index_name)
+        await search_client.merge_or_upload_documents(
+            [{**document, "corpus_version": corpus_version} for document in documents]
+        )
+
+        # Remove records left over from previous versions of the corpus
+        stale_results = await search_client.search(
+            search_text="*",
+            filter=f"corpus_version ne '{corpus_version}' or corpus_version eq null",
+            select=["id"]
+        )
+        stale_documents = [{"id": result["id"]} async for result in stale_results]
+        if stale_documents:
+            await search_client.delete_documents(stale_documents)
+
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(bootstrap_index(force="--force" in sys.argv))
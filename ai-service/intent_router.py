@@ -0,0 +1,90 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Fast path for questions a single plugin call answers completely, e.g. "Is Barcelona available?".
+# A match skips retrieval and both model round-trips (choosing the tool, then phrasing its result),
+# anything the patterns do not match exactly goes to the agent as before.
+#
+#   INTENT_ROUTER_ENABLED   answer matching questions without the model (default true)
+
+import os
+import re
+import logging
+
+from dataclasses import dataclass
+from typing import Optional
+
+from plugins.plugin_functions import DestinationsPlugin, WeatherInfoPlugin
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Patterns------------------------------------------------------------
+
+# Matched against the whole normalized message, a question with anything more in it is not a fast-path question
+AVAILABILITY_PATTERNS = [
+    re.compile(r"^(?:is|are) (?P<destination>.+?) (?:still |currently )?(?:available|open|bookable)(?: for booking| to book| right now| now)?$"),
+    re.compile(r"^(?:check |what is |what's |whats )?(?:the )?availability (?:of|for) (?P<destination>.+)$")
+]
+
+TEMPERATURE_PATTERNS = [
+    re.compile(r"^(?:what is|what's|whats) the (?:average |avg |typical |usual )?temperature (?:of|in|at|for) (?P<destination>.+)$"),
+    re.compile(r"^(?:average |avg )?temperature (?:of|in|at|for) (?P<destination>.+)$"),
+    re.compile(r"^how (?:hot|warm|cold) is (?:it in |the weather in )?(?P<destination>.+)$")
+]
+
+
+def normalize(text: str) -> str:
+    text = " ".join(text.lower().split())
+    return text.rstrip("?!. ")
+
+
+@dataclass
+class RoutedReply:
+    intent: str
+    function_name: str
+    destination: str
+    reply: str
+
+
+# -------------------------------------------------------------Intent Router------------------------------------------------------------
+
+class IntentRouter:
+    """Answers availability and temperature questions straight from the plugins the agent would call"""
+    def __init__(self, destinations_plugin: DestinationsPlugin, weather_plugin: WeatherInfoPlugin):
+        self.destinations_plugin = destinations_plugin
+        self.weather_plugin = weather_plugin
+        # Exact name and alias lookups only, a fuzzy match is left to the agent
+        self.catalog = destinations_plugin.catalog
+
+    @staticmethod
+    def match(patterns: list, text: str) -> Optional[str]:
+        for pattern in patterns:
+            found = pattern.match(text)
+            if found:
+                return found.group("destination")
+        return None
+
+    async def route(self, user_input: str) -> Optional[RoutedReply]:
+        """The plugin's answer when the message is exactly a known question about a known destination, else None.
+        Replies come from the same plugin functions the agent calls, so both paths answer alike"""
+        text = normalize(user_input)
+
+        destination = self.match(AVAILABILITY_PATTERNS, text)
+        match = self.catalog.exact(destination) if destination else None
+        if match is not None and match.availability:
+            reply = await self.destinations_plugin.get_availability(match.name)
+            return RoutedReply("availability", "get_availability", match.name, reply)
+
+        destination = self.match(TEMPERATURE_PATTERNS, text)
+        match = self.catalog.exact(destination) if destination else None
+        if match is not None and match.avg_temperature:
+            reply = await self.weather_plugin.get_destination_temperature(match.name)
+            return RoutedReply("temperature", "get_destination_temperature", match.name, reply)
+
+        return None
+
+
+def create_intent_router() -> Optional[IntentRouter]:
+    if os.getenv("INTENT_ROUTER_ENABLED", "true").lower() != "true":
+        return None
+    return IntentRouter(DestinationsPlugin(), WeatherInfoPlugin())
@@ -0,0 +1,137 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Non-blocking structured logging: records are put on an in-memory queue by the request path and
+# formatted and written to stdout by a background thread (QueueHandler -> QueueListener).
+#
+#   LOG_LEVEL        root level, DEBUG when DEBUG_MODE is on (default INFO)
+#   LOG_FORMAT       json (default) or text
+#   LOG_SAMPLE_RATE  share of requests whose DEBUG/INFO records are kept, warnings and errors are always kept
+#   LOG_QUEUE_SIZE   records buffered for the writer thread, records beyond it are dropped (default 10000)
+#   DEBUG_MODE       verbose per-request logging, keep it off in production
+
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+from contextvars import ContextVar
+from datetime import datetime, UTC
+
+from metrics import LOG_RECORDS_DROPPED
+
+
+# -------------------------------------------------------------Request Context------------------------------------------------------------
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+request_sampled: ContextVar[bool] = ContextVar("request_sampled", default=True)
+
+_sample_rate = 1.0
+_debug = False
+_listener = None
+_listener_pid = None
+
+
+def debug_mode() -> bool:
+    return _debug
+
+
+def start_request_context(request_id: str = None) -> str:
+    """Set the request ID and the sampling decision for the current request, tasks spawned afterwards share them"""
+    request_id = request_id or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    request_sampled.set(_sample_rate >= 1.0 or random.random() < _sample_rate)
+    return request_id
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request ID and drop DEBUG/INFO records of requests that were not sampled"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return record.levelno >= logging.WARNING or request_sampled.get()
+
+
+# -------------------------------------------------------------Handlers & Formatters------------------------------------------------------------
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Only merges the message arguments on the calling side, formatting happens on the listener thread.
+    A full queue drops the record instead of blocking the event loop
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+# Attributes every LogRecord has, anything else was passed through extra={...}
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, the request ID and the fields passed through extra"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+# -------------------------------------------------------------Setup------------------------------------------------------------
+
+def configure_logging():
+    """
+    Route every logger through the queue, called after the environment is loaded and again in each worker:
+    the writer thread does not survive a fork, so a forked worker starts its own
+    """
+    global _listener, _listener_pid, _sample_rate, _debug
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+
+    _debug = os.getenv("DEBUG_MODE", "false").lower() == "true"
+    level = os.getenv("LOG_LEVEL", "DEBUG" if _debug else "INFO").upper()
+    _sample_rate = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000))))
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    # Client libraries log every HTTP call at INFO
+    if not _debug:
+        for name in ("azure", "httpx", "semantic_kernel"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_listener.stop)
@@ -0,0 +1,165 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+import os
+import time
+import asyncio
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+
+# -------------------------------------------------------------Prometheus Metrics------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+
+STAGE_LATENCY = Histogram(
+    "chat_stage_duration_seconds",
+    "Latency of each stage of the /chat pipeline",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+PLUGIN_LATENCY = Histogram(
+    "plugin_invocation_duration_seconds",
+    "Latency of each plugin function invoked by the agent",
+    ["plugin", "function"],
+    buckets=LATENCY_BUCKETS
+)
+
+TOOL_CALL_TIMEOUTS = Counter(
+    "tool_call_timeouts_total",
+    "Plugin functions called by the model that did not finish within TOOL_CALL_TIMEOUT",
+    ["plugin", "function"]
+)
+
+SESSION_LOCK_WAIT = Histogram(
+    "session_lock_wait_seconds",
+    "Time a request waited for earlier requests of the same session",
+    buckets=LATENCY_BUCKETS
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache (retrieval_local is the in-process tier) and result",
+    ["cache", "result"]
+)
+
+SINGLE_FLIGHT_SHARED = Counter(
+    "single_flight_shared_total",
+    "Loads that joined an identical in-flight load instead of starting their own",
+    ["name"]
+)
+
+FAST_PATH_REPLIES = Counter(
+    "intent_fast_path_replies_total",
+    "Chat turns answered by the intent router without calling the model",
+    ["intent"]
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the logging queue was full"
+)
+
+
+# Pool usage is sampled into gauges, summed over the live workers of the pod in multiprocess mode
+POOL_IN_USE = Gauge(
+    "client_pool_connections_in_use",
+    "Connections checked out of the pool",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+POOL_IDLE = Gauge(
+    "client_pool_connections_idle",
+    "Open connections waiting in the pool",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+POOL_MAX = Gauge(
+    "client_pool_max_connections",
+    "Configured size of the pool",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+# Pool name -> stats() returning {"in_use": int, "idle": int, "max": int}, registered by clients.py
+pool_stats = {}
+
+
+def sample_pools():
+    for pool, stats in list(pool_stats.items()):
+        try:
+            values = stats()
+        except Exception:
+            continue
+        POOL_IN_USE.labels(pool=pool).set(values["in_use"])
+        POOL_IDLE.labels(pool=pool).set(values["idle"])
+        POOL_MAX.labels(pool=pool).set(values["max"])
+
+
+async def sample_pools_forever(interval: float):
+    """Keep this worker's pool gauges fresh, other workers cannot read them at scrape time"""
+    while True:
+        sample_pools()
+        await asyncio.sleep(interval)
+
+
+def render_metrics() -> bytes:
+    """
+    Exposition for /metrics. Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+    and whichever worker serves the scrape aggregates all of them
+    """
+    sample_pools()
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+# -------------------------------------------------------------Per-request Timings------------------------------------------------------------
+
+# Stage name -> seconds for the current request, read back into the Server-Timing header
+request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> dict:
+    """Start collecting stage timings for the current request, tasks spawned afterwards share the dict"""
+    timings = {}
+    request_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, elapsed: float):
+    STAGE_LATENCY.labels(stage=stage).observe(elapsed)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+@asynccontextmanager
+async def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def server_timing_header(timings: dict) -> str:
+    """Format timings as a Server-Timing header value, durations in milliseconds"""
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings.items())
+
+
+async def timed(stage: str, awaitable):
+    """Await a coroutine inside a stage timer, handy inside asyncio.gather"""
+    async with stage_timer(stage):
+        return await awaitable
@@ -0,0 +1,125 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Destination data behind the plugins, loaded once per process from a CSV file.
+# Names and aliases are looked up in a dict, misspellings through a trigram index over the same keys.
+#
+#   DESTINATION_CATALOG_PATH   CSV with columns name, country, aliases (";" separated), availability, avg_temperature
+#                              (default plugins/data/destinations.csv)
+
+import os
+import csv
+
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), "data", "destinations.csv")
+
+
+@dataclass(frozen=True)
+class Destination:
+    name: str
+    country: str
+    aliases: tuple
+    availability: str
+    avg_temperature: str
+
+    @property
+    def display_name(self) -> str:
+        return f"{self.name}, {self.country}" if self.country else self.name
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, commas and surrounding punctuation removed, "the maldives" -> "maldives" """
+    name = " ".join(name.lower().replace(",", " ").split()).strip("?!. ")
+    return name[4:] if name.startswith("the ") else name
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# -------------------------------------------------------------Destination Catalog------------------------------------------------------------
+
+class DestinationCatalog:
+    def __init__(self, destinations: List[Destination], min_similarity: float = 0.5):
+        self.destinations = destinations
+        self.min_similarity = min_similarity
+
+        # Normalized name, "name country" and aliases -> destination
+        self.by_key = {}
+        for destination in destinations:
+            keys = [destination.name, *destination.aliases]
+            if destination.country:
+                keys.append(f"{destination.name} {destination.country}")
+            for key in keys:
+                self.by_key.setdefault(normalize_name(key), destination)
+
+        # Trigram -> keys containing it, fuzzy lookups only score keys sharing a trigram with the query
+        self.key_trigrams = {key: trigrams(key) for key in self.by_key}
+        self.trigram_index = {}
+        for key, grams in self.key_trigrams.items():
+            for gram in grams:
+                self.trigram_index.setdefault(gram, []).append(key)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "DestinationCatalog":
+        with open(path, newline="", encoding="utf-8") as catalog_file:
+            destinations = [
+                Destination(
+                    name=row["name"].strip(),
+                    country=row.get("country", "").strip(),
+                    aliases=tuple(alias.strip() for alias in row.get("aliases", "").split(";") if alias.strip()),
+                    availability=row.get("availability", "").strip(),
+                    avg_temperature=row.get("avg_temperature", "").strip()
+                )
+                for row in csv.DictReader(catalog_file)
+                if row.get("name", "").strip()
+            ]
+        return cls(destinations)
+
+    def exact(self, query: str) -> Optional[Destination]:
+        return self.by_key.get(normalize_name(query))
+
+    def ranked(self, query: str) -> list:
+        """(similarity, key) of every key sharing a trigram with the query, most similar first"""
+        query_grams = trigrams(normalize_name(query))
+        shared = Counter(key for gram in query_grams for key in self.trigram_index.get(gram, ()))
+        scored = [
+            (2 * count / (len(query_grams) + len(self.key_trigrams[key])), key)
+            for key, count in shared.items()
+        ]
+        return sorted(scored, reverse=True)
+
+    def find(self, query: str) -> Optional[Destination]:
+        """Exact name or alias first, else the most similar one when it is similar enough"""
+        destination = self.exact(query)
+        if destination is not None:
+            return destination
+        for similarity, key in self.ranked(query)[:1]:
+            if similarity >= self.min_similarity:
+                return self.by_key[key]
+        return None
+
+    def suggest(self, query: str, limit: int = 5, where=None) -> List[Destination]:
+        """Closest destinations to offer when a lookup fails, limited to those where(destination) holds"""
+        suggestions = []
+        candidates = [self.by_key[key] for _, key in self.ranked(query)] + self.destinations
+        for destination in candidates:
+            if destination not in suggestions and (where is None or where(destination)):
+                suggestions.append(destination)
+            if len(suggestions) == limit:
+                break
+        return suggestions
+
+
+@lru_cache(maxsize=None)
+def load_catalog(path: Optional[str] = None) -> DestinationCatalog:
+    """The catalog at path (or DESTINATION_CATALOG_PATH), loaded once per process"""
+    return DestinationCatalog.from_csv(path or catalog_path())
+
+
+def catalog_path() -> str:
+    return os.getenv("DESTINATION_CATALOG_PATH", DEFAULT_CATALOG_PATH)
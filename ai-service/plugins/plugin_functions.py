@@ -1,24 +1,22 @@
 import random
-from typing import Annotated
+from typing import Annotated, Optional
 from semantic_kernel.functions import kernel_function
 
+from plugins.destination_catalog import DestinationCatalog, load_catalog
+
 
 # -------------------------------------------------------------Destinations Plugin------------------------------------------------------------
 
 
+# Data lookups are async so a plugin backed by a remote source awaits it instead of blocking the event loop,
+# and the parallel tool calls of one model turn run concurrently (see tool_call_filter in travelAgent.py)
 class DestinationsPlugin:
-    def __init__(self):
+    def __init__(self, catalog: Optional[DestinationCatalog] = None):
+        self.catalog = catalog or load_catalog()
+
+        # Bookable destinations of the catalog, the ones with an availability
         self.destinations = [
-            "Barcelona, Spain",
-            "Paris, France",
-            "Berlin, Germany",
-            "Tokyo, Japan",
-            "Sydney, Australia",
-            "New York, USA",
-            "Cairo, Egypt",
-            "Cape Town, South Africa",
-            "Rio de Janeiro, Brazil",
-            "Bali, Indonesia"
+            destination.display_name for destination in self.catalog.destinations if destination.availability
         ]
 
         self.last_destination = None
@@ -38,22 +36,23 @@ class DestinationsPlugin:
 
         return destination
     
-    @kernel_function(description="Provides the availability of a destination.")
-    def get_availability(
+    @kernel_function(description="Lists the destinations that are currently available.")
+    async def get_available_destinations(self) -> Annotated[str, "Returns the names of the available destinations."]:
+        return ", ".join(
+            destination.name for destination in self.catalog.destinations if destination.availability.lower() == "available"
+        )
+
+    @kernel_function(description="Provides the availability of a single destination.")
+    async def get_availability(
         self, destination: Annotated[str, "The destination to check availability for."]
     ) -> Annotated[str, "Returns the availability of the destination."]:
-        return """
-        Barcelona - Unavailable
-        Paris - Available
-        Berlin - Available
-        Tokyo - Unavailable
-        New York - Available
-        Sydney - Available
-        Cairo - Available
-        Cape Town - Available
-        Rio de Janeiro - Unavailable
-        Bali - Avaialable
-        """ 
+        # Only the requested row goes back to the model, not the whole catalog
+        match = self.catalog.find(destination)
+        if match is not None and match.availability:
+            return f"{match.name} - {match.availability}"
+
+        suggestions = self.catalog.suggest(destination, where=lambda row: bool(row.availability))
+        return f"No availability information for {destination}. Similar destinations: {', '.join(row.name for row in suggestions)}."
     
 
 
@@ -78,20 +77,17 @@ class PromptPlugin:
 
 class WeatherInfoPlugin:
     """A Plugin that provides the average temperature for a travel destination."""
-    def __init__(self):
-        # Dictionary of destinations and their average temperatures
-        self.destination_temperatures = {
-            "maldives": "82°F (28°C)",
-            "swiss alps": "45°F (7°C)",
-            "african safaris": "75°F (24°C)"
-        }
+    def __init__(self, catalog: Optional[DestinationCatalog] = None):
+        # Destinations and their average temperatures
+        self.catalog = catalog or load_catalog()
+
     @kernel_function(description="Get the average temperature for a specific travel destination.")
-    def get_destination_temperature(self, destination: str) -> Annotated[str, "Returns the average temperature for the destination."]:
+    async def get_destination_temperature(self, destination: str) -> Annotated[str, "Returns the average temperature for the destination."]:
         """Get the average temperature for a travel destination."""
-        normalized_destination = destination.lower()
+        match = self.catalog.find(destination)
 
-        if normalized_destination in self.destination_temperatures:
-            return f"The average temperature in {destination} is {self.destination_temperatures[normalized_destination]}."
+        if match is not None and match.avg_temperature:
+            return f"The average temperature in {match.name} is {match.avg_temperature}."
         else:
-            return f"Sorry, I don't have temperature information for {destination}. Available destinations are: Maldives, Swiss Alps, and African safaris."
-        
\ No newline at end of file
+            suggestions = self.catalog.suggest(destination, where=lambda row: bool(row.avg_temperature))
+            return f"Sorry, I don't have temperature information for {destination}. Available destinations are: {', '.join(row.name for row in suggestions)}."
@@ -0,0 +1,142 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+import hashlib
+import json
+import logging
+import re
+import time
+
+from typing import Optional, Set
+
+from single_flight import jittered_ttl
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Normalization------------------------------------------------------------
+
+# Words that change the phrasing of a question but not what is being asked
+FILLER_WORDS = {
+    "please", "pls", "hi", "hello", "hey", "um", "uh", "just", "kindly", "thanks", "thank",
+    "you", "can", "could", "would", "tell", "me", "so", "well", "ok", "okay", "actually"
+}
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and filler words, collapse whitespace"""
+    words = re.sub(r"[^\w\s]", " ", text.lower()).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def shingles(normalized: str) -> Set[str]:
+    """Word unigrams and bigrams of a normalized text"""
+    words = normalized.split()
+    grams = set(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return grams
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# -------------------------------------------------------------Response Cache------------------------------------------------------------
+
+""" Cache answer structure
+answer:{fingerprint}  (Redis hash, one field per cached question)
+{
+    sha1(normalized question): {
+        "shingles": ["is", "barcelona", "is barcelona", ...],
+        "reply": "text of the assistant reply",
+        "created": 1718000000.0
+    }
+}
+"""
+
+class ResponseCache:
+    """
+    Opt-in cache of agent replies for stateless, FAQ-style questions.
+    Replies are grouped by a fingerprint of the retrieved context and plugin data, and a question
+    matches a cached one when the Jaccard similarity of their shingles reaches the threshold
+    """
+    def __init__(
+        self,
+        redis_client,
+        enabled: bool = False,
+        threshold: float = 0.85,
+        ttl: int = 3600,
+        max_entries: int = 500,
+        max_history: int = 0,
+    ):
+        self.redis_client = redis_client
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Sessions with more history than this bypass the cache, their replies depend on the conversation
+        self.max_history = max_history
+
+    @staticmethod
+    def fingerprint(retrieval_context: str, plugin_fingerprint: str) -> str:
+        payload = f"{plugin_fingerprint}\n{retrieval_context}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    async def lookup(self, user_input: str, fingerprint: str) -> Optional[str]:
+        """Return the cached reply of the most similar question above the threshold"""
+        normalized = normalize_text(user_input)
+        if not normalized:
+            return None
+
+        try:
+            entries = await self.redis_client.hgetall(f"answer:{fingerprint}")
+        except Exception as e:
+            logger.warning("Cache miss for response: %s", e)
+            return None
+
+        field = hashlib.sha1(normalized.encode("utf-8")).hexdigest().encode("utf-8")
+        query_shingles = shingles(normalized)
+        now = time.time()
+
+        best_score, best_reply = 0.0, None
+        for entry_field, raw_entry in entries.items():
+            entry = json.loads(raw_entry.decode("utf-8"))
+            if entry["created"] + self.ttl < now:
+                continue
+
+            score = 1.0 if entry_field == field else jaccard(query_shingles, set(entry["shingles"]))
+            if score >= self.threshold and score > best_score:
+                best_score, best_reply = score, entry["reply"]
+
+        return best_reply
+
+    async def store(self, user_input: str, fingerprint: str, reply: str):
+        """Cache a reply, evicting the oldest entries of the fingerprint when it grows past max_entries"""
+        normalized = normalize_text(user_input)
+        if not normalized or not reply:
+            return
+
+        try:
+            cache_answer_key = f"answer:{fingerprint}"
+            field = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+            entry = {
+                "shingles": sorted(shingles(normalized)),
+                "reply": reply,
+                "created": time.time()
+            }
+
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hset(cache_answer_key, field, json.dumps(entry))
+                pipe.expire(cache_answer_key, jittered_ttl(self.ttl))
+                pipe.hlen(cache_answer_key)
+                _, _, entry_count = await pipe.execute()
+
+            if entry_count > self.max_entries:
+                entries = await self.redis_client.hgetall(cache_answer_key)
+                by_age = sorted(entries.items(), key=lambda item: json.loads(item[1].decode("utf-8"))["created"])
+                stale_fields = [entry_field for entry_field, _ in by_age[:entry_count - self.max_entries]]
+                await self.redis_client.hdel(cache_answer_key, *stale_fields)
+
+        except Exception as e:
+            logger.warning("Failed to cache response: %s", e)
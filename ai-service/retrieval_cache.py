@@ -0,0 +1,163 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from single_flight import SingleFlight, jittered_ttl
+from retrievers import retrieval_degraded
+from metrics import record_cache_lookup
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Helpers------------------------------------------------------------
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivially different queries share one entry"""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+def get_documents_version(documents: list) -> str:
+    """Content hash of a document set, used to namespace cached retrieval results"""
+    payload = json.dumps(documents, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+# -------------------------------------------------------------Retrieval Cache------------------------------------------------------------
+
+""" Cache retrieval structure
+retrieval:{index_name}:{version}:{sha1(normalized query)}
+"Document: ...\n\nDocument: ..."
+"""
+
+class RetrievalCache:
+    """
+    Two-tier cache for retrieval context.
+    Tier 1 is an in-process LRU (per worker), tier 2 is Redis (shared by all workers and pods).
+    Keys carry the index version, so re-uploading the index switches to a fresh namespace.
+    Concurrent misses for the same query share one search, TTLs are jittered and a Redis entry close to
+    expiry is refreshed in the background by one reader, with a probability that grows as the TTL runs out.
+    Results a fallback engine produced are kept locally for fallback_ttl only and never shared through Redis
+    """
+    def __init__(
+        self,
+        index_name: str,
+        version: str = "",
+        max_size: int = 1024,
+        local_ttl: int = 300,
+        redis_ttl: int = 3600,
+        refresh_ahead: float = 0.1,
+        fallback_ttl: int = 30,
+    ):
+        self.index_name = index_name
+        self.version = version
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.refresh_ahead = refresh_ahead
+        self.fallback_ttl = fallback_ttl
+        self.redis_client = None
+        self._flights = SingleFlight("retrieval")
+        self._refresh_tasks = set()
+
+        # key -> (expires_at, context), ordered from least to most recently used
+        self._local: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+
+    def attach_redis(self, redis_client):
+        """Enable the shared Redis tier"""
+        self.redis_client = redis_client
+
+    def _key(self, query: str) -> str:
+        digest = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"retrieval:{self.index_name}:{self.version}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+
+        expires_at, context = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+
+        self._local.move_to_end(key)
+        return context
+
+    def _set_local(self, key: str, context: str, ttl: Optional[int] = None):
+        self._local[key] = (time.monotonic() + jittered_ttl(ttl or self.local_ttl), context)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    def _should_refresh(self, remaining_ttl: int) -> bool:
+        """Refresh ahead during the last refresh_ahead share of the TTL, more likely the closer the expiry"""
+        window = self.redis_ttl * self.refresh_ahead
+        return 0 <= remaining_ttl < window * random.random()
+
+    def _schedule_refresh(self, key: str, query: str, fetch: Callable[[str], Awaitable[str]]):
+        refresh_key = f"refresh:{key}"
+        if self._flights.in_flight(refresh_key):
+            return
+
+        task = asyncio.create_task(self._flights.do(refresh_key, lambda: self._fetch_and_store(key, query, fetch)))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _fetch_and_store(self, key: str, query: str, fetch: Callable[[str], Awaitable[str]]) -> str:
+        # fetch runs in this task, a fallback retriever marks its degraded answer in this context
+        retrieval_degraded.set(False)
+        context = await fetch(query)
+        if retrieval_degraded.get():
+            self._set_local(key, context, ttl=self.fallback_ttl)
+            return context
+
+        self._set_local(key, context)
+
+        if self.redis_client is not None:
+            try:
+                await self.redis_client.set(key, context, ex=jittered_ttl(self.redis_ttl))
+            except Exception as e:
+                logger.warning("Failed to cache retrieval context: %s", e)
+
+        return context
+
+    async def _load(self, key: str, query: str, fetch: Callable[[str], Awaitable[str]]) -> str:
+        """Redis tier, then the search itself. Runs once per key for all concurrent callers"""
+        if self.redis_client is not None:
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.ttl(key)
+                    cached_data, remaining_ttl = await pipe.execute()
+                record_cache_lookup("retrieval", hit=bool(cached_data))
+                if cached_data:
+                    context = cached_data.decode("utf-8")
+                    self._set_local(key, context)
+                    if self._should_refresh(remaining_ttl):
+                        self._schedule_refresh(key, query, fetch)
+                    return context
+            except Exception as e:
+                logger.warning("Cache miss for retrieval context: %s", e)
+
+        return await self._fetch_and_store(key, query, fetch)
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[str], Awaitable[str]]) -> str:
+        """Return cached context for the query, calling fetch(query) only when both tiers miss"""
+        key = self._key(query)
+
+        context = self._get_local(key)
+        record_cache_lookup("retrieval_local", hit=context is not None)
+        if context is not None:
+            return context
+
+        return await self._flights.do(key, lambda: self._load(key, query, fetch))
@@ -0,0 +1,267 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Retrieval engines behind get_retrieval_context, selected with RETRIEVER=azure|bm25|azure_with_fallback.
+# Build the BM25 index file ahead of time with `python retrievers.py`.
+
+import logging
+import os
+import re
+import json
+import asyncio
+import tempfile
+
+from contextvars import ContextVar
+from typing import List
+
+import numpy as np
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.aio import SearchClient
+
+from clients import create_search_transport, close_search_transport
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Retriever Interface------------------------------------------------------------
+
+class Retriever:
+    """Interface of a retrieval engine, returns the content of the best matching documents"""
+    name = "retriever"
+
+    async def search(self, query: str, top_k: int = 50) -> List[str]:
+        raise NotImplementedError
+
+    async def open(self):
+        """Open connections, called inside the running event loop at startup"""
+        pass
+
+    async def close(self):
+        pass
+
+
+# -------------------------------------------------------------Azure AI Search------------------------------------------------------------
+
+class AzureSearchRetriever(Retriever):
+    name = "azure"
+
+    def __init__(self, endpoint: str, index_name: str, api_key: str):
+        self.endpoint = endpoint
+        self.index_name = index_name
+        self.api_key = api_key
+        self.search_client = None
+        self.transport = None
+
+    async def open(self):
+        """The client runs on the shared, tuned aiohttp pool from clients.py"""
+        if self.search_client is not None:
+            return
+        self.transport = create_search_transport()
+        self.search_client = SearchClient(
+            endpoint=self.endpoint,
+            index_name=self.index_name,
+            credential=AzureKeyCredential(self.api_key),
+            transport=self.transport
+        )
+
+    async def search(self, query: str, top_k: int = 50) -> List[str]:
+        if self.search_client is None:
+            await self.open()
+        results = await self.search_client.search(query, top=top_k)
+        return [result["content"] async for result in results]
+
+    async def close(self):
+        if self.search_client is None:
+            return
+        await self.search_client.close()
+        await close_search_transport(self.transport)
+        self.search_client = None
+        self.transport = None
+
+
+# -------------------------------------------------------------BM25------------------------------------------------------------
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class BM25Retriever(Retriever):
+    """
+    In-process BM25 over an inverted index stored as flat NumPy arrays (CSR layout).
+    postings_docs[indptr[t]:indptr[t + 1]] are the documents containing term t and
+    postings_weights holds their precomputed BM25 term weights, so a query is a handful of vectorized adds
+    """
+    name = "bm25"
+
+    def __init__(self, contents: List[str], vocabulary: dict, indptr: np.ndarray, postings_docs: np.ndarray, postings_weights: np.ndarray, version: str = ""):
+        self.version = version
+        self.contents = contents
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.postings_docs = postings_docs
+        self.postings_weights = postings_weights
+
+    @classmethod
+    def build(cls, contents: List[str], version: str = "", k1: float = 1.5, b: float = 0.75) -> "BM25Retriever":
+        doc_terms = [tokenize(content) for content in contents]
+        doc_lengths = np.array([len(terms) for terms in doc_terms], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(contents) else 0.0
+
+        # term -> {doc_id: term frequency}
+        postings = {}
+        for doc_id, terms in enumerate(doc_terms):
+            for term in terms:
+                term_postings = postings.setdefault(term, {})
+                term_postings[doc_id] = term_postings.get(doc_id, 0) + 1
+
+        vocabulary = {term: term_id for term_id, term in enumerate(sorted(postings))}
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        docs_per_term, frequencies_per_term = [], []
+        for term, term_id in vocabulary.items():
+            term_postings = postings[term]
+            indptr[term_id + 1] = indptr[term_id] + len(term_postings)
+            docs_per_term.append(np.fromiter(term_postings.keys(), dtype=np.int32, count=len(term_postings)))
+            frequencies_per_term.append(np.fromiter(term_postings.values(), dtype=np.float32, count=len(term_postings)))
+
+        postings_docs = np.concatenate(docs_per_term) if docs_per_term else np.zeros(0, dtype=np.int32)
+        frequencies = np.concatenate(frequencies_per_term) if frequencies_per_term else np.zeros(0, dtype=np.float32)
+
+        # Okapi BM25 weight of every (term, document) pair
+        document_frequency = np.diff(indptr).astype(np.float32)
+        idf = np.log(1.0 + (len(contents) - document_frequency + 0.5) / (document_frequency + 0.5))
+        idf_per_posting = np.repeat(idf, np.diff(indptr))
+        length_norm = 1.0 - b + b * doc_lengths[postings_docs] / max(avg_length, 1e-9)
+        postings_weights = (idf_per_posting * frequencies * (k1 + 1.0) / (frequencies + k1 * length_norm)).astype(np.float32)
+
+        return cls(list(contents), vocabulary, indptr, postings_docs, postings_weights, version)
+
+    def save(self, path: str):
+        """Write to a temporary file next to path and rename it over path, so no reader sees a partly written index"""
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), prefix=".bm25_", suffix=".npz", delete=False) as tmp_file:
+            tmp_path = tmp_file.name
+        try:
+            np.savez_compressed(
+                tmp_path,
+                version=np.array([self.version], dtype=str),
+                terms=np.array(terms, dtype=str),
+                contents=np.array([json.dumps(self.contents)], dtype=str),
+                indptr=self.indptr,
+                postings_docs=self.postings_docs,
+                postings_weights=self.postings_weights
+            )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Retriever":
+        with np.load(path) as data:
+            vocabulary = {str(term): term_id for term_id, term in enumerate(data["terms"])}
+            contents = json.loads(str(data["contents"][0]))
+            return cls(contents, vocabulary, data["indptr"], data["postings_docs"], data["postings_weights"], str(data["version"][0]))
+
+    def top_k(self, query: str, top_k: int = 50) -> List[str]:
+        scores = np.zeros(len(self.contents), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # A document appears once per term, so fancy-index add is safe here
+            scores[self.postings_docs[start:end]] += self.postings_weights[start:end]
+
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        ranked = matched[np.argsort(-scores[matched], kind="stable")]
+        return [self.contents[doc_id] for doc_id in ranked]
+
+    async def search(self, query: str, top_k: int = 50) -> List[str]:
+        return self.top_k(query, top_k)
+
+
+# -------------------------------------------------------------Fallback------------------------------------------------------------
+
+# Set when the fallback engine answered, so RetrievalCache does not share the degraded result for its full TTL
+retrieval_degraded: ContextVar[bool] = ContextVar("retrieval_degraded", default=False)
+
+
+class FallbackRetriever(Retriever):
+    """Query the primary engine, answer from the fallback when it is slower than the timeout or fails"""
+
+    def __init__(self, primary: Retriever, fallback: Retriever, timeout: float):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.name = f"{primary.name}_with_fallback"
+
+    async def search(self, query: str, top_k: int = 50) -> List[str]:
+        try:
+            return await asyncio.wait_for(self.primary.search(query, top_k), timeout=self.timeout)
+        except Exception as e:
+            logger.warning("%s retrieval failed, using %s: %r", self.primary.name, self.fallback.name, e)
+            retrieval_degraded.set(True)
+            return await self.fallback.search(query, top_k)
+
+    async def open(self):
+        await self.primary.open()
+        await self.fallback.open()
+
+    async def close(self):
+        await self.primary.close()
+        await self.fallback.close()
+
+
+# -------------------------------------------------------------Factory------------------------------------------------------------
+
+def load_or_build_bm25(path: str, documents: List[dict], version: str) -> BM25Retriever:
+    """Load the persisted BM25 index, rebuilding and saving it when missing or built from another corpus version"""
+    if os.path.exists(path):
+        try:
+            retriever = BM25Retriever.load(path)
+            if retriever.version == version:
+                return retriever
+        except Exception as e:
+            # e.g. a file truncated by an older writer, rebuilding replaces it
+            logger.warning("Failed to load BM25 index from %s, rebuilding it: %s", path, e)
+
+    retriever = BM25Retriever.build([document["content"] for document in documents], version)
+    try:
+        retriever.save(path)
+    except OSError as e:
+        logger.warning("Failed to persist BM25 index to %s: %s", path, e)
+    return retriever
+
+
+def create_retriever(kind: str, documents: List[dict], index_name: str, version: str) -> Retriever:
+    bm25_index_path = os.getenv("BM25_INDEX_PATH", "bm25_index.npz")
+
+    if kind == "bm25":
+        return load_or_build_bm25(bm25_index_path, documents, version)
+
+    azure = AzureSearchRetriever(
+        endpoint=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"),
+        index_name=index_name,
+        api_key=os.getenv("AZURE_SEARCH_API_KEY")
+    )
+    if kind == "azure_with_fallback":
+        return FallbackRetriever(
+            azure,
+            load_or_build_bm25(bm25_index_path, documents, version),
+            timeout=float(os.getenv("RETRIEVER_TIMEOUT", 2.0))
+        )
+    if kind != "azure":
+        raise ValueError(f"Unknown RETRIEVER '{kind}', expected azure, bm25 or azure_with_fallback")
+    return azure
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from index_bootstrap import documents, corpus_version
+
+    load_dotenv()
+    path = os.getenv("BM25_INDEX_PATH", "bm25_index.npz")
+    BM25Retriever.build([document["content"] for document in documents], corpus_version).save(path)
+    print(f"Saved BM25 index for {len(documents)} documents to {path}")
@@ -0,0 +1,124 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+import logging
+import time
+import uuid
+import random
+import asyncio
+import weakref
+
+from contextlib import asynccontextmanager
+
+from metrics import SESSION_LOCK_WAIT, record_stage
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------Session Lock------------------------------------------------------------
+
+""" Lock structure
+session_lock:{session_id}
+"random token of the holder"  (PX ttl, extended while the holder is alive)
+"""
+
+# Only the holder (matching token) may extend or delete the lock
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SessionLockTimeout(Exception):
+    pass
+
+
+class SessionLock:
+    """
+    Serializes requests of one session while different sessions stay fully parallel.
+    Within a worker, requests queue FIFO on an asyncio.Lock per session; across workers and pods
+    the holder owns a Redis key (SET NX PX) that is extended until it is done.
+    If Redis is unreachable the lock degrades to the in-process lock instead of failing the request
+    """
+    def __init__(self, redis_client, ttl_ms: int = 30000, timeout: float = 60.0):
+        self.redis_client = redis_client
+        self.ttl_ms = ttl_ms
+        self.timeout = timeout
+        self._local_locks = weakref.WeakValueDictionary()
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+        self._extend = redis_client.register_script(EXTEND_SCRIPT)
+
+    def _local_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._local_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._local_locks[session_id] = lock
+        return lock
+
+    async def _acquire_redis(self, key: str, token: str, deadline: float) -> bool:
+        """Poll with jittered backoff until the key is ours, False when Redis is unavailable"""
+        delay = 0.01
+        while True:
+            try:
+                if await self.redis_client.set(key, token, nx=True, px=self.ttl_ms):
+                    return True
+            except Exception as e:
+                logger.warning("Session lock unavailable, continuing with the local lock: %s", e)
+                return False
+
+            if time.monotonic() > deadline:
+                raise SessionLockTimeout(f"Timed out waiting for {key}")
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, 0.2)
+
+    async def _keep_alive(self, key: str, token: str):
+        while True:
+            await asyncio.sleep(self.ttl_ms / 3000)
+            try:
+                await self._extend(keys=[key], args=[token, self.ttl_ms])
+            except Exception as e:
+                logger.warning("Failed to extend session lock: %s", e)
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        key = f"session_lock:{session_id}"
+        token = uuid.uuid4().hex
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        local_lock = self._local_lock(session_id)
+        try:
+            await asyncio.wait_for(local_lock.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise SessionLockTimeout(f"Timed out waiting for {key}")
+
+        keep_alive = None
+        try:
+            holds_redis = await self._acquire_redis(key, token, deadline)
+
+            wait = time.monotonic() - start
+            SESSION_LOCK_WAIT.observe(wait)
+            record_stage("session_lock", wait)
+
+            if holds_redis:
+                keep_alive = asyncio.create_task(self._keep_alive(key, token))
+            try:
+                yield
+            finally:
+                if keep_alive:
+                    keep_alive.cancel()
+                if holds_redis:
+                    try:
+                        await self._release(keys=[key], args=[token])
+                    except Exception as e:
+                        logger.warning("Failed to release session lock: %s", e)
+        finally:
+            local_lock.release()
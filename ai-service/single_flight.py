@@ -0,0 +1,46 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+import random
+import asyncio
+
+from typing import Awaitable, Callable, Dict
+
+from metrics import SINGLE_FLIGHT_SHARED
+
+
+# -------------------------------------------------------------Stampede Protection------------------------------------------------------------
+
+def jittered_ttl(ttl: int, jitter: float = 0.1) -> int:
+    """Spread a TTL by +/- jitter so keys written together do not all expire in the same second"""
+    return max(1, int(ttl * random.uniform(1 - jitter, 1 + jitter)))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a worker: the first caller starts the load,
+    later callers await the same future until it finishes. Nothing is cached once it is done.
+    A caller that is cancelled does not cancel the shared load for the others
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Mark the error as retrieved even if every caller was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            SINGLE_FLIGHT_SHARED.labels(name=self.name).inc()
+
+        return await asyncio.shield(future)
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
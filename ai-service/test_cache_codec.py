@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from cache_codec import MAGIC, VERSION_MSGPACK, VERSION_MSGPACK_ZSTD, CacheCodec
+
+
+MESSAGE = {"role": "USER", "content": "Is Barcelona available?", "timestamp": "2025-06-01T10:00:00+00:00"}
+
+
+def test_decodes_legacy_json_entries():
+    codec = CacheCodec()
+    legacy = json.dumps(MESSAGE).encode("utf-8")
+    assert codec.decode(legacy) == MESSAGE
+
+
+def test_json_codec_writes_the_legacy_format():
+    raw = CacheCodec(codec="json").encode(MESSAGE)
+    assert json.loads(raw) == MESSAGE
+    # Workers on the new codec read what older ones wrote
+    assert CacheCodec().decode(raw) == MESSAGE
+
+
+def test_small_values_are_plain_msgpack():
+    codec = CacheCodec(compress_min_bytes=1024)
+    raw = codec.encode(MESSAGE)
+    assert raw[:2] == MAGIC + bytes([VERSION_MSGPACK])
+    assert codec.decode(raw) == MESSAGE
+
+
+def test_large_values_are_compressed():
+    codec = CacheCodec(compress_min_bytes=64)
+    window = [MESSAGE] * 50
+    raw = codec.encode(window)
+    assert raw[:2] == MAGIC + bytes([VERSION_MSGPACK_ZSTD])
+    assert len(raw) < len(json.dumps(window))
+    assert codec.decode(raw) == window
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(ValueError):
+        CacheCodec().decode(MAGIC + bytes([99]) + b"body")
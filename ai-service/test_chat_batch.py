@@ -0,0 +1,122 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import api_server
+
+
+class FakeChat:
+    """Stands in for run_chat: each message sleeps for its own time, "fail" raises"""
+    def __init__(self, seconds: dict):
+        self.seconds = seconds
+        self.log = []
+
+    async def __call__(self, session_id: str, user_input: str) -> str:
+        self.log.append(f"start {user_input}")
+        await asyncio.sleep(self.seconds.get(user_input, 0))
+        if user_input == "fail":
+            raise RuntimeError("model unavailable")
+        self.log.append(f"done {user_input}")
+        return f"reply to {user_input}"
+
+
+@pytest.fixture
+def fake_chat(monkeypatch) -> FakeChat:
+    fake = FakeChat({"a1": 0.3, "a2": 0.05, "b1": 0.1, "c1": 0.2})
+    monkeypatch.setattr(api_server, "run_chat", fake)
+    # A fresh semaphore, it binds to the event loop of the test that first waits on it
+    monkeypatch.setattr(api_server, "batch_semaphore", asyncio.Semaphore(8))
+    return fake
+
+
+def batch(*items: tuple[str, str]) -> dict:
+    return {"items": [{"session_id": session_id, "message": message} for session_id, message in items]}
+
+
+async def post_batch(body: dict) -> httpx.Response:
+    # The transport does not run the lifespan, nothing connects
+    transport = httpx.ASGITransport(app=api_server.create_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        return await client.post("/chat/batch", json=body)
+
+
+def test_results_stream_in_completion_order(fake_chat):
+    response = asyncio.run(post_batch(batch(("a", "a1"), ("b", "b1"), ("a", "a2"), ("c", "c1"))))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    # b1 at 0.1s, c1 at 0.2s, a1 at 0.3s and a2, queued behind it in the same session, last
+    assert [line["index"] for line in lines] == [1, 3, 0, 2]
+    assert lines[0] == {"index": 1, "session_id": "b", "reply": "reply to b1"}
+    assert fake_chat.log.index("start a2") > fake_chat.log.index("done a1")
+
+
+def test_failed_turn_is_reported_on_its_line(fake_chat):
+    response = asyncio.run(post_batch(batch(("a", "fail"), ("a", "a2"))))
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [
+        {"index": 0, "session_id": "a", "error": "model unavailable"},
+        {"index": 1, "session_id": "a", "reply": "reply to a2"}
+    ]
+
+
+def test_oversized_batch_is_rejected(fake_chat, monkeypatch):
+    monkeypatch.setattr(api_server, "batch_max_items", 3)
+
+    response = asyncio.run(post_batch(batch(*[("a", f"m{i}") for i in range(4)])))
+    assert response.status_code == 413
+    assert response.json() == {"error": "Batch has 4 items, the limit is 3"}
+    assert fake_chat.log == []
+
+    assert asyncio.run(post_batch(batch(*[("a", f"m{i}") for i in range(3)]))).status_code == 200
+
+
+def test_running_turns_finish_after_the_client_disconnects(monkeypatch):
+    """
+    httpx's ASGITransport reads the whole body before it lets the app see a disconnect,
+    so the client here speaks ASGI directly and hangs up after the first line
+    """
+    fake = FakeChat({"a1": 0.05, "b1": 0.3, "c1": 0.05})
+    monkeypatch.setattr(api_server, "run_chat", fake)
+    monkeypatch.setattr(api_server, "batch_semaphore", asyncio.Semaphore(1))
+
+    async def scenario():
+        app = api_server.create_app()
+        body = json.dumps(batch(("a", "a1"), ("b", "b1"), ("c", "c1"))).encode()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/chat/batch", "raw_path": b"/chat/batch", "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"content-type", b"application/json")],
+            "client": ("127.0.0.1", 50000), "server": ("testserver", 80)
+        }
+        first_line = asyncio.Event()
+        chunks = []
+        requests = iter([{"type": "http.request", "body": body, "more_body": False}])
+
+        async def receive():
+            request = next(requests, None)
+            if request is not None:
+                return request
+            await first_line.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                chunks.append(message["body"])
+                first_line.set()
+
+        await app(scope, receive, send)
+        # b1 started before the client left
+        assert "start b1" in fake.log and "done b1" not in fake.log
+        await asyncio.wait(api_server.batch_tasks, timeout=5)
+        return chunks
+
+    chunks = asyncio.run(scenario())
+    assert [json.loads(chunk)["index"] for chunk in chunks] == [0]
+    # b1 was running and finished, c1 had not started and never does
+    assert fake.log == ["start a1", "done a1", "start b1", "done b1"]
+    assert not api_server.batch_tasks
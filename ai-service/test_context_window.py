@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+import context_window
+from context_window import MESSAGE_OVERHEAD_TOKENS, fit_to_budget, plan_summary, to_millis, unsummarized
+
+
+START = datetime(2025, 6, 1, 10, 0, 0, tzinfo=UTC)
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # 4 characters per token, the same on every machine whether or not tiktoken can load its encoding
+    monkeypatch.setattr(context_window, "_encoding", None)
+    monkeypatch.setattr(context_window, "_encoding_loaded", True)
+
+
+def message(content: str, timestamp: datetime, role: str = "USER") -> dict:
+    return {"role": role, "content": content, "timestamp": timestamp.isoformat()}
+
+
+def conversation(count: int, step: timedelta = timedelta(seconds=1)) -> list:
+    return [message(f"msg {i:03d}", START + i * step, "USER" if i % 2 == 0 else "ASSISTANT") for i in range(count)]
+
+
+# -------------------------------------------------------------Budget------------------------------------------------------------
+
+def test_budget_cut_is_exact():
+    # "msg 000" is 7 characters, 2 tokens, plus the per-message overhead
+    messages = conversation(5)
+    per_message = 2 + MESSAGE_OVERHEAD_TOKENS
+
+    kept, dropped = fit_to_budget(messages, 3 * per_message)
+    assert kept == messages[2:] and dropped == messages[:2]
+
+    kept, dropped = fit_to_budget(messages, 3 * per_message - 1)
+    assert kept == messages[3:] and dropped == messages[:3]
+
+
+def test_newest_message_is_always_kept():
+    messages = conversation(2) + [message("x" * 400, START + timedelta(seconds=5))]
+    kept, dropped = fit_to_budget(messages, 1)
+    assert kept == messages[-1:]
+    assert dropped == messages[:-1]
+
+
+def test_empty_history():
+    assert fit_to_budget([], 100) == ([], [])
+
+
+# -------------------------------------------------------------Millisecond Precision------------------------------------------------------------
+
+def test_to_millis_truncates_microseconds():
+    assert to_millis("2025-06-01T10:00:00.123999+00:00") == datetime(2025, 6, 1, 10, 0, 0, 123000, tzinfo=UTC)
+    # Naive timestamps come from MongoDB and are UTC
+    assert to_millis(datetime(2025, 6, 1, 10, 0, 0, 123456)) == datetime(2025, 6, 1, 10, 0, 0, 123000, tzinfo=UTC)
+    assert to_millis(None) is None
+
+
+def test_summary_until_read_back_from_mongodb_covers_its_millisecond():
+    folded = message("folded", START + timedelta(microseconds=123999))
+    newer = message("newer", START + timedelta(milliseconds=124))
+    # MongoDB keeps milliseconds, the cached timestamp still has its microseconds
+    summary_until = datetime(2025, 6, 1, 10, 0, 0, 123000)
+    assert unsummarized([folded, newer], summary_until) == [newer]
+
+
+# -------------------------------------------------------------Summary Plan------------------------------------------------------------
+
+def test_nothing_to_summarize_returns_none():
+    window = conversation(4)
+    # Everything fits
+    assert plan_summary(window, window, None, window_full=False) is None
+    assert plan_summary([], [], None, window_full=False) is None
+
+    # The summary already covers everything before the first kept message
+    kept = window[2:]
+    summary_until = to_millis(kept[0]["timestamp"]) - timedelta(milliseconds=1)
+    assert plan_summary(window, kept, summary_until, window_full=True) is None
+    assert plan_summary(window, kept, summary_until + timedelta(seconds=5), window_full=True) is None
+
+
+def test_dropped_messages_are_planned_once():
+    window = conversation(6)
+    kept = window[4:]
+    plan = plan_summary(window, kept, None, window_full=False)
+    assert plan.messages == window[:4]
+    assert plan.read_before is None
+    assert plan.summary_until == to_millis(kept[0]["timestamp"]) - timedelta(milliseconds=1)
+
+    # Next turn, one more message fell out of the budget
+    kept = window[5:]
+    plan = plan_summary(window, kept, plan.summary_until, window_full=False)
+    assert plan.messages == [window[4]]
+
+
+def test_message_sharing_the_boundary_millisecond_waits():
+    # The user message and the reply were saved in the same millisecond
+    user = message("question", START + timedelta(seconds=2, microseconds=500100))
+    reply = message("answer", START + timedelta(seconds=2, microseconds=500900), "ASSISTANT")
+    window = conversation(2) + [user, reply]
+
+    plan = plan_summary(window, [reply], None, window_full=False)
+    assert plan.messages == window[:2]
+    assert plan.summary_until < to_millis(user["timestamp"])
+
+    # Once the reply is dropped too, both are folded and neither was folded before
+    later = message("follow up", START + timedelta(seconds=3))
+    plan = plan_summary(window + [later], [later], plan.summary_until, window_full=False)
+    assert plan.messages == [user, reply]
+
+
+def test_full_window_reads_trimmed_messages_back():
+    window = conversation(10)[4:]
+    kept = window[-2:]
+    plan = plan_summary(window, kept, None, window_full=True)
+    assert plan.read_before == datetime.fromisoformat(window[0]["timestamp"])
+
+    # A summary that already covers what the window trimmed needs no read
+    covered = to_millis(window[0]["timestamp"]) - timedelta(milliseconds=1)
+    plan = plan_summary(window, kept, covered, window_full=True)
+    assert plan.read_before is None
+    assert plan.messages == window[:-2]
+
+
+# -------------------------------------------------------------Rolling Summary------------------------------------------------------------
+
+def fold(history: list, window: list, plan, summary_until) -> list:
+    """What refresh_summary folds for a plan: messages read back from the database, then the plan's own"""
+    messages = plan.messages
+    if plan.read_before is not None:
+        cutoff, before = to_millis(summary_until), to_millis(plan.read_before)
+        in_window = {(msg["role"], msg["content"], to_millis(msg["timestamp"])) for msg in window}
+        older = [
+            msg for msg in history
+            if (cutoff is None or to_millis(msg["timestamp"]) > cutoff) and to_millis(msg["timestamp"]) <= before
+            and (msg["role"], msg["content"], to_millis(msg["timestamp"])) not in in_window
+        ]
+        messages = older + messages
+    return messages
+
+
+@pytest.mark.parametrize("window_size, budget, refresh_every", [(6, 20, 1), (6, 20, 3), (10, 36, 1), (4, 1000, 2)])
+def test_every_trimmed_turn_is_folded_exactly_once(window_size, budget, refresh_every):
+    """Turns of a user and an assistant message saved in the same millisecond, with a window that trims old turns.
+    Summaries are refreshed only every refresh_every turns, as when a refresh is still running or failed"""
+    history = []
+    folded = []
+    summary_until = None
+    kept = []
+
+    for turn in range(40):
+        at = START + timedelta(seconds=turn)
+        history += [
+            message(f"question {turn}", at + timedelta(microseconds=100)),
+            message(f"answer {turn}", at + timedelta(microseconds=700), "ASSISTANT")
+        ]
+        window = history[-window_size:]
+        kept, _ = fit_to_budget(window, budget)
+        plan = plan_summary(window, kept, summary_until, window_full=len(window) >= window_size)
+        if plan is not None and turn % refresh_every == 0:
+            folded += fold(history, window, plan, summary_until)
+            summary_until = plan.summary_until
+
+    contents = [msg["content"] for msg in folded]
+    assert len(contents) == len(set(contents)), "a message was folded twice"
+
+    # Everything the summary claims to cover was folded, in order, and nothing after it
+    covered = [msg["content"] for msg in history if to_millis(msg["timestamp"]) <= summary_until]
+    assert contents == covered
+    assert covered and history.index(kept[0]) >= len(covered)
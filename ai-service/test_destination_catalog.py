@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from plugins.destination_catalog import DEFAULT_CATALOG_PATH, Destination, DestinationCatalog, load_catalog, normalize_name
+from plugins.plugin_functions import DestinationsPlugin, WeatherInfoPlugin
+
+
+CSV = """name,country,aliases,availability,avg_temperature
+Barcelona,Spain,,Unavailable,
+Paris,France,,Available,
+New York,USA,NYC;New York City,Available,
+Maldives,,,,82°F (28°C)
+,Nowhere,,Available,
+"""
+
+
+@pytest.fixture
+def catalog(tmp_path) -> DestinationCatalog:
+    path = tmp_path / "destinations.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return DestinationCatalog.from_csv(str(path))
+
+
+# -------------------------------------------------------------Catalog------------------------------------------------------------
+
+def test_csv_loading(catalog):
+    # Rows without a name are skipped, aliases are split on ";"
+    assert [destination.name for destination in catalog.destinations] == ["Barcelona", "Paris", "New York", "Maldives"]
+    assert catalog.exact("nyc") == Destination("New York", "USA", ("NYC", "New York City"), "Available", "")
+    assert catalog.exact("Maldives").display_name == "Maldives"
+    assert catalog.exact("Paris").display_name == "Paris, France"
+
+
+def test_shipped_catalog_loads():
+    shipped = load_catalog(DEFAULT_CATALOG_PATH)
+    assert shipped.exact("Rio").name == "Rio de Janeiro"
+    assert load_catalog(DEFAULT_CATALOG_PATH) is shipped
+
+
+@pytest.mark.parametrize("query, name", [
+    ("Paris", "Paris"),
+    ("  PARIS?! ", "Paris"),
+    ("the maldives", "Maldives"),
+    ("New York, USA", "New York"),
+    ("new   york city", "New York"),
+])
+def test_exact_lookup_after_normalization(catalog, query, name):
+    assert catalog.exact(query).name == name
+    assert catalog.find(query).name == name
+
+
+@pytest.mark.parametrize("query, name", [
+    ("Barcelone", "Barcelona"),
+    ("Pariss", "Paris"),
+    ("Maldivs", "Maldives"),
+    ("newyork", "New York"),
+])
+def test_typos_match_above_the_threshold(catalog, query, name):
+    assert catalog.exact(query) is None
+    assert catalog.find(query).name == name
+
+
+@pytest.mark.parametrize("query", ["Tokyo", "Atlantis", "xyz", ""])
+def test_no_match_below_the_threshold(catalog, query):
+    assert catalog.find(query) is None
+
+
+def test_threshold_is_configurable(catalog):
+    similarity, key = catalog.ranked("Parisian")[0]
+    assert key == "paris" and similarity < 1
+
+    strict = DestinationCatalog(catalog.destinations, min_similarity=similarity + 0.01)
+    loose = DestinationCatalog(catalog.destinations, min_similarity=similarity)
+    assert strict.find("Parisian") is None
+    assert loose.find("Parisian").name == "Paris"
+
+
+def test_suggestions_are_closest_first_and_filtered(catalog):
+    assert [row.name for row in catalog.suggest("Barcelon", limit=2)] == ["Barcelona", "Paris"]
+    suggestions = catalog.suggest("Maldive", where=lambda row: bool(row.availability))
+    assert "Maldives" not in [row.name for row in suggestions]
+    assert len(suggestions) == 3
+
+
+def test_normalize_name():
+    assert normalize_name(" The  Swiss Alps. ") == "swiss alps"
+    assert normalize_name("Cape Town, South Africa") == "cape town south africa"
+
+
+# -------------------------------------------------------------Plugins------------------------------------------------------------
+
+def test_available_destinations(catalog):
+    plugin = DestinationsPlugin(catalog)
+    assert asyncio.run(plugin.get_available_destinations()) == "Paris, New York"
+    # Random picks come from everything with an availability
+    assert plugin.destinations == ["Barcelona, Spain", "Paris, France", "New York, USA"]
+
+
+@pytest.mark.parametrize("query, reply", [
+    ("Barcelona", "Barcelona - Unavailable"),
+    ("barcelone", "Barcelona - Unavailable"),
+    ("NYC", "New York - Available"),
+])
+def test_availability(catalog, query, reply):
+    assert asyncio.run(DestinationsPlugin(catalog).get_availability(query)) == reply
+
+
+def test_availability_without_a_match_suggests_bookable_destinations(catalog):
+    reply = asyncio.run(DestinationsPlugin(catalog).get_availability("Maldives"))
+    assert reply.startswith("No availability information for Maldives. Similar destinations: ")
+    assert "Maldives," not in reply and "Paris" in reply
+
+
+def test_temperature(catalog):
+    plugin = WeatherInfoPlugin(catalog)
+    assert asyncio.run(plugin.get_destination_temperature("the maldive")) == "The average temperature in Maldives is 82°F (28°C)."
+    reply = asyncio.run(plugin.get_destination_temperature("Paris"))
+    assert reply == "Sorry, I don't have temperature information for Paris. Available destinations are: Maldives."
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from intent_router import IntentRouter, normalize
+from plugins.destination_catalog import DestinationCatalog
+from plugins.plugin_functions import DestinationsPlugin, WeatherInfoPlugin
+
+
+CSV = """name,country,aliases,availability,avg_temperature
+Barcelona,Spain,,Unavailable,
+Paris,France,,Available,
+New York,USA,NYC,Available,
+Maldives,,,,82°F (28°C)
+Swiss Alps,Switzerland,Alps,,45°F (7°C)
+"""
+
+
+class SpyDestinationsPlugin(DestinationsPlugin):
+    def __init__(self, catalog):
+        super().__init__(catalog)
+        self.calls = []
+
+    async def get_availability(self, destination):
+        self.calls.append(destination)
+        return await super().get_availability(destination)
+
+
+class SpyWeatherInfoPlugin(WeatherInfoPlugin):
+    def __init__(self, catalog):
+        super().__init__(catalog)
+        self.calls = []
+
+    async def get_destination_temperature(self, destination):
+        self.calls.append(destination)
+        return await super().get_destination_temperature(destination)
+
+
+@pytest.fixture
+def router(tmp_path) -> IntentRouter:
+    path = tmp_path / "destinations.csv"
+    path.write_text(CSV, encoding="utf-8")
+    catalog = DestinationCatalog.from_csv(str(path))
+    return IntentRouter(SpyDestinationsPlugin(catalog), SpyWeatherInfoPlugin(catalog))
+
+
+def route(router: IntentRouter, text: str):
+    return asyncio.run(router.route(text))
+
+
+# -------------------------------------------------------------Routed------------------------------------------------------------
+
+@pytest.mark.parametrize("text, destination", [
+    ("Is Barcelona available?", "Barcelona"),
+    ("is paris available", "Paris"),
+    ("Is Paris still available for booking?", "Paris"),
+    ("Is NYC currently open?", "New York"),
+    ("Is New York, USA bookable right now?", "New York"),
+    ("  IS   BARCELONA   AVAILABLE?!  ", "Barcelona"),
+    ("Check availability of Paris", "Paris"),
+    ("What's the availability for Barcelona?", "Barcelona"),
+    ("availability of new york", "New York"),
+])
+def test_availability_questions_are_routed(router, text, destination):
+    routed = route(router, text)
+    assert (routed.intent, routed.function_name, routed.destination) == ("availability", "get_availability", destination)
+    # The reply is the plugin's own answer
+    assert router.destinations_plugin.calls == [destination]
+    assert routed.reply == asyncio.run(DestinationsPlugin(router.catalog).get_availability(destination))
+
+
+@pytest.mark.parametrize("text, destination", [
+    ("What is the average temperature of the Maldives?", "Maldives"),
+    ("what's the temperature in Maldives", "Maldives"),
+    ("Whats the typical temperature for the Swiss Alps?", "Swiss Alps"),
+    ("Average temperature in the Alps", "Swiss Alps"),
+    ("temperature of maldives", "Maldives"),
+    ("How warm is it in the Maldives?", "Maldives"),
+    ("How cold is the weather in the Swiss Alps?", "Swiss Alps"),
+])
+def test_temperature_questions_are_routed(router, text, destination):
+    routed = route(router, text)
+    assert (routed.intent, routed.function_name, routed.destination) == ("temperature", "get_destination_temperature", destination)
+    assert router.weather_plugin.calls == [destination]
+    assert routed.reply == asyncio.run(WeatherInfoPlugin(router.catalog).get_destination_temperature(destination))
+
+
+# -------------------------------------------------------------Falls Through------------------------------------------------------------
+
+@pytest.mark.parametrize("text", [
+    # Not one of the questions
+    "Book me a trip to Paris",
+    "Plan a week in Barcelona",
+    "Hello",
+    "",
+    # Anything more than the question goes to the agent
+    "Is Barcelona available in June?",
+    "Is Paris available and how much are flights?",
+    "What is the average temperature of the Maldives in December?",
+    "Can you tell me if Paris is available?",
+    # Unknown or misspelled destinations, fuzzy matching is left to the agent
+    "Is Atlantis available?",
+    "Is Barcelone available?",
+    "What is the temperature in Pariss?",
+])
+def test_other_messages_fall_through(router, text):
+    assert route(router, text) is None
+    assert router.destinations_plugin.calls == [] and router.weather_plugin.calls == []
+
+
+@pytest.mark.parametrize("text", [
+    # Known destinations without the data the question asks for
+    "Is the Maldives available?",
+    "What is the temperature in Paris?",
+    # More than one destination
+    "Is Paris or Barcelona available?",
+    "Is Paris, Barcelona available?",
+])
+def test_ambiguous_questions_fall_through(router, text):
+    assert route(router, text) is None
+
+
+def test_normalize():
+    assert normalize("  Is   Paris AVAILABLE?!. ") == "is paris available"
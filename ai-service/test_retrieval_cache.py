@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+import pytest
+
+from fakeredis import FakeAsyncRedis, FakeServer
+
+import retrieval_cache
+from retrieval_cache import RetrievalCache, get_documents_version, normalize_query
+from retrievers import retrieval_degraded
+
+
+class Search:
+    """Counts searches per query, answers from the fallback engine while degraded is set"""
+    def __init__(self, degraded: bool = False):
+        self.queries = []
+        self.degraded = degraded
+
+    async def __call__(self, query: str) -> str:
+        self.queries.append(query)
+        if self.degraded:
+            retrieval_degraded.set(True)
+        return f"Document: {query}"
+
+
+def make_cache(redis_client=None, version: str = "v1", **kwargs) -> RetrievalCache:
+    cache = RetrievalCache("travel-documents", version, **kwargs)
+    if redis_client is not None:
+        cache.attach_redis(redis_client)
+    return cache
+
+
+# -------------------------------------------------------------Tiers------------------------------------------------------------
+
+def test_results_are_shared_through_redis():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        search = Search()
+        first = await make_cache(redis_client).get_or_fetch("Paris museums", search)
+        # Another worker with an empty local tier
+        second = await make_cache(redis_client).get_or_fetch("paris  MUSEUMS?", search)
+        keys = await redis_client.keys("*")
+        return first, second, search.queries, keys, await redis_client.ttl(keys[0])
+
+    first, second, queries, keys, ttl = asyncio.run(scenario())
+    assert first == second == "Document: Paris museums"
+    assert queries == ["Paris museums"]
+    assert len(keys) == 1 and keys[0].startswith(b"retrieval:travel-documents:v1:")
+    assert 3600 * 0.9 <= ttl <= 3600 * 1.1
+
+
+def test_fallback_results_stay_out_of_redis():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        search = Search(degraded=True)
+        cache = make_cache(redis_client, fallback_ttl=30)
+        context = await cache.get_or_fetch("Paris", search)
+        # Served from the local tier until the short TTL runs out
+        await cache.get_or_fetch("Paris", search)
+        expires_at, _ = cache._local[cache._key("Paris")]
+
+        # Once the primary engine answers again, its result is shared
+        search.degraded = False
+        cache._local.clear()
+        await cache.get_or_fetch("Paris", search)
+        return context, search.queries, expires_at - time.monotonic(), await redis_client.keys("*")
+
+    context, queries, local_ttl, keys = asyncio.run(scenario())
+    assert context == "Document: Paris"
+    assert queries == ["Paris", "Paris"]
+    assert local_ttl <= 30 * 1.1
+    assert len(keys) == 1
+
+
+def test_degraded_flag_does_not_leak_into_the_caller():
+    async def scenario():
+        await make_cache(FakeAsyncRedis()).get_or_fetch("Paris", Search(degraded=True))
+        return retrieval_degraded.get()
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_works_without_redis():
+    async def scenario():
+        server = FakeServer()
+        server.connected = False
+        search = Search()
+        cache = make_cache(FakeAsyncRedis(server=server))
+        return [await cache.get_or_fetch("Paris", search) for _ in range(2)], search.queries
+
+    results, queries = asyncio.run(scenario())
+    assert results == ["Document: Paris"] * 2
+    assert queries == ["Paris"]
+
+
+# -------------------------------------------------------------Local Tier------------------------------------------------------------
+
+def test_least_recently_used_entry_is_evicted():
+    async def scenario():
+        search = Search()
+        cache = make_cache(max_size=2)
+        for query in ["a", "b", "a", "c"]:
+            await cache.get_or_fetch(query, search)
+        search.queries.clear()
+        for query in ["a", "c", "b"]:
+            await cache.get_or_fetch(query, search)
+        return search.queries, len(cache._local)
+
+    queries, size = asyncio.run(scenario())
+    # "a" was used after "b", so "b" made room for "c"
+    assert queries == ["b"]
+    assert size == 2
+
+
+def test_expired_local_entry_is_fetched_again(monkeypatch):
+    async def scenario():
+        search = Search()
+        cache = make_cache(local_ttl=10)
+        await cache.get_or_fetch("Paris", search)
+        now = time.monotonic()
+        monkeypatch.setattr(retrieval_cache.time, "monotonic", lambda: now + 12)
+        await cache.get_or_fetch("Paris", search)
+        return search.queries
+
+    assert asyncio.run(scenario()) == ["Paris", "Paris"]
+
+
+def test_concurrent_misses_share_one_search():
+    async def scenario():
+        search = Search()
+        cache = make_cache(FakeAsyncRedis())
+        results = await asyncio.gather(*[cache.get_or_fetch("Paris", search) for _ in range(5)])
+        return results, search.queries
+
+    results, queries = asyncio.run(scenario())
+    assert results == ["Document: Paris"] * 5
+    assert queries == ["Paris"]
+
+
+# -------------------------------------------------------------Versions------------------------------------------------------------
+
+def test_versions_have_their_own_namespace():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        search = Search()
+        await make_cache(redis_client, "v1").get_or_fetch("Paris", search)
+        await make_cache(redis_client, "v2").get_or_fetch("Paris", search)
+        await make_cache(redis_client, "v1").get_or_fetch("Paris", search)
+        return search.queries, sorted(await redis_client.keys("*"))
+
+    queries, keys = asyncio.run(scenario())
+    # The new version misses, the old entries are still there for workers on the old version
+    assert queries == ["Paris", "Paris"]
+    assert [key.split(b":")[2] for key in keys] == [b"v1", b"v2"]
+
+
+def test_documents_version_follows_the_content():
+    documents = [{"id": "1", "content": "Paris"}]
+    assert get_documents_version(documents) == get_documents_version([{"content": "Paris", "id": "1"}])
+    assert get_documents_version(documents) != get_documents_version([{"id": "1", "content": "Paris!"}])
+
+
+def test_normalize_query():
+    assert normalize_query("  What's in PARIS?! ") == "what s in paris"
+
+
+# -------------------------------------------------------------Refresh Ahead------------------------------------------------------------
+
+@pytest.mark.parametrize("remaining, refreshed", [(10, True), (3000, False)])
+def test_entry_close_to_expiry_is_refreshed_in_the_background(monkeypatch, remaining, refreshed):
+    monkeypatch.setattr(retrieval_cache.random, "random", lambda: 1.0)
+
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        cache = make_cache(redis_client)
+        key = cache._key("Paris")
+        await redis_client.set(key, "Document: old", ex=remaining)
+        search = Search()
+        # The reader gets the cached context right away
+        context = await cache.get_or_fetch("Paris", search)
+        if cache._refresh_tasks:
+            await asyncio.wait(cache._refresh_tasks)
+        return context, search.queries, await redis_client.get(key), await redis_client.ttl(key)
+
+    context, queries, stored, ttl = asyncio.run(scenario())
+    assert context == "Document: old"
+    if refreshed:
+        assert queries == ["Paris"] and stored == b"Document: Paris" and ttl > 3000
+    else:
+        assert queries == [] and stored == b"Document: old"
@@ -0,0 +1,136 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+import retrievers
+from retrievers import BM25Retriever, load_or_build_bm25, tokenize
+
+
+CONTENTS = [
+    "Paris is the capital of France, famous for the Eiffel Tower and its museums",
+    "Barcelona has beaches, tapas and the Sagrada Familia",
+    "The Swiss Alps are great for skiing and hiking in the mountains",
+    "Paris museums: the Louvre and the Musée d'Orsay. Paris in spring is lovely, Paris cafés too",
+    "Maldives beaches and overwater villas",
+]
+
+
+def documents(contents: list) -> list:
+    return [{"content": content} for content in contents]
+
+
+# -------------------------------------------------------------Index------------------------------------------------------------
+
+def test_tokenize():
+    assert tokenize("Paris, FRANCE! Eiffel-Tower") == ["paris", "france", "eiffel", "tower"]
+
+
+def test_build():
+    retriever = BM25Retriever.build(CONTENTS, "v1")
+    assert retriever.version == "v1"
+    assert len(retriever.indptr) == len(retriever.vocabulary) + 1
+    assert len(retriever.postings_docs) == len(retriever.postings_weights) == retriever.indptr[-1]
+
+    # Each term lists every document containing it once
+    term_id = retriever.vocabulary["paris"]
+    start, end = retriever.indptr[term_id], retriever.indptr[term_id + 1]
+    assert sorted(retriever.postings_docs[start:end]) == [0, 3]
+    assert (retriever.postings_weights > 0).all()
+
+
+def test_empty_corpus():
+    retriever = BM25Retriever.build([], "v1")
+    assert retriever.top_k("paris") == []
+
+
+# -------------------------------------------------------------Ranking------------------------------------------------------------
+
+def test_top_k_ranks_by_score():
+    retriever = BM25Retriever.build(CONTENTS)
+    # Three mentions of Paris outrank one, documents without any query term are left out
+    assert retriever.top_k("Paris museums") == [CONTENTS[3], CONTENTS[0]]
+    # A rare term outweighs a common one
+    assert retriever.top_k("beaches tapas") == [CONTENTS[1], CONTENTS[4]]
+
+
+def test_top_k_limit():
+    retriever = BM25Retriever.build(CONTENTS)
+    everything = retriever.top_k("the paris beaches", top_k=50)
+    assert len(everything) == 5
+    for limit in range(1, 6):
+        assert retriever.top_k("the paris beaches", top_k=limit) == everything[:limit]
+
+
+def test_no_matching_terms():
+    retriever = BM25Retriever.build(CONTENTS)
+    assert retriever.top_k("tokyo sushi") == []
+    assert asyncio.run(retriever.search("")) == []
+
+
+# -------------------------------------------------------------Persistence------------------------------------------------------------
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "bm25_index.npz")
+    built = BM25Retriever.build(CONTENTS, "v1")
+    built.save(path)
+    loaded = BM25Retriever.load(path)
+
+    assert loaded.version == "v1"
+    assert loaded.contents == CONTENTS
+    assert loaded.vocabulary == built.vocabulary
+    np.testing.assert_array_equal(loaded.postings_weights, built.postings_weights)
+    for query in ["Paris museums", "beaches", "hiking in the Alps", "Musée d'Orsay"]:
+        assert loaded.top_k(query) == built.top_k(query)
+
+    # Written through a temporary file in the same directory, nothing is left behind
+    assert os.listdir(tmp_path) == ["bm25_index.npz"]
+
+
+def test_failed_save_keeps_the_previous_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "bm25_index.npz")
+    BM25Retriever.build(CONTENTS, "v1").save(path)
+
+    def crash(file, **arrays):
+        with open(file, "wb") as f:
+            f.write(b"PK truncated")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(retrievers.np, "savez_compressed", crash)
+    with pytest.raises(OSError):
+        BM25Retriever.build(CONTENTS[:2], "v2").save(path)
+
+    assert os.listdir(tmp_path) == ["bm25_index.npz"]
+    assert BM25Retriever.load(path).version == "v1"
+
+
+def test_load_or_build_reuses_a_matching_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "bm25_index.npz")
+    load_or_build_bm25(path, documents(CONTENTS), "v1")
+    assert os.path.exists(path)
+
+    def no_build(*args, **kwargs):
+        raise AssertionError("the saved index should have been loaded")
+
+    monkeypatch.setattr(BM25Retriever, "build", no_build)
+    assert load_or_build_bm25(path, documents(CONTENTS), "v1").contents == CONTENTS
+
+
+def test_load_or_build_rebuilds_on_version_mismatch(tmp_path):
+    path = str(tmp_path / "bm25_index.npz")
+    load_or_build_bm25(path, documents(CONTENTS), "v1")
+
+    retriever = load_or_build_bm25(path, documents(CONTENTS[:2]), "v2")
+    assert retriever.version == "v2" and retriever.contents == CONTENTS[:2]
+    # The rebuilt index replaced the old one on disk
+    assert BM25Retriever.load(path).version == "v2"
+
+
+def test_load_or_build_rebuilds_a_corrupt_index(tmp_path):
+    path = tmp_path / "bm25_index.npz"
+    path.write_bytes(b"PK truncated")
+
+    retriever = load_or_build_bm25(str(path), documents(CONTENTS), "v1")
+    assert retriever.top_k("skiing") == [CONTENTS[2]]
+    assert BM25Retriever.load(str(path)).version == "v1"
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from fakeredis import FakeAsyncRedis
+from mongomock_motor import AsyncMongoMockClient
+from semantic_kernel.agents import ChatHistoryAgentThread
+from semantic_kernel.contents import ChatHistory
+
+import api_server
+
+
+class FailingMessages:
+    """A Messages collection whose inserts fail"""
+    async def insert_many(self, documents, **kwargs):
+        raise RuntimeError("insert failed")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = AsyncMongoMockClient()["AI-service"]
+    monkeypatch.setattr(api_server, "threads_collection", db["Threads"])
+    monkeypatch.setattr(api_server, "msg_collection", db["Messages"])
+    monkeypatch.setattr(api_server, "redis_client", FakeAsyncRedis())
+    monkeypatch.setattr(api_server, "write_behind_queue", None)
+    return db
+
+
+def make_thread(*turns: tuple[str, str]) -> ChatHistoryAgentThread:
+    history = ChatHistory()
+    for question, answer in turns:
+        history.add_user_message(question)
+        history.add_assistant_message(answer)
+    return ChatHistoryAgentThread(chat_history=history, thread_id="thread_s1")
+
+
+async def saved(db) -> tuple[list, dict]:
+    contents = [doc["content"] async for doc in db["Messages"].find({"thread_id": "thread_s1"}).sort("timestamp", 1)]
+    thread = await db["Threads"].find_one({"session_id": "s1"}, {"_id": 0, "msg_count": 1, "thread_id": 1})
+    return contents, thread
+
+
+def test_new_messages_and_count_are_saved(db):
+    async def scenario():
+        await api_server.save_thread("s1", make_thread(("hi", "hello")), 0, 0)
+        # The next turn loaded the two saved messages
+        await api_server.save_thread("s1", make_thread(("hi", "hello"), ("bye", "goodbye")), 2, 2)
+        return await saved(db), await api_server.get_cached_thread_info("s1")
+
+    (contents, thread), cached = asyncio.run(scenario())
+    assert contents == ["hi", "hello", "bye", "goodbye"]
+    assert thread == {"thread_id": "thread_s1", "msg_count": 4}
+    assert cached["msg_count"] == 4
+
+
+def test_late_count_update_does_not_lower_the_count(db):
+    async def scenario():
+        await api_server.save_thread("s1", make_thread(("hi", "hello"), ("bye", "goodbye")), 2, 2)
+        # An older save whose count update lands last
+        await api_server.save_thread("s1", make_thread(("hi", "hello")), 0, 0)
+        return await saved(db)
+
+    _, thread = asyncio.run(scenario())
+    assert thread["msg_count"] == 4
+
+
+def test_failed_insert_takes_the_count_back(db, monkeypatch):
+    async def scenario():
+        await api_server.save_thread("s1", make_thread(("hi", "hello")), 0, 0)
+        monkeypatch.setattr(api_server, "msg_collection", FailingMessages())
+        with pytest.raises(RuntimeError):
+            await api_server.save_thread("s1", make_thread(("hi", "hello"), ("bye", "goodbye")), 2, 2)
+        return await saved(db), await api_server.get_cached_thread_info("s1")
+
+    (contents, thread), cached = asyncio.run(scenario())
+    assert contents == ["hi", "hello"]
+    assert thread["msg_count"] == 2
+    # The cache is not advanced either
+    assert cached["msg_count"] == 2
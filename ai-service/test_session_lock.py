@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from fakeredis import FakeAsyncRedis, FakeServer
+
+from session_lock import SessionLock, SessionLockTimeout
+
+
+KEY = "session_lock:s1"
+
+
+def test_release_deletes_only_our_key():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        lock = SessionLock(redis_client, ttl_ms=1000, timeout=1)
+
+        async with lock.hold("s1"):
+            assert await redis_client.get(KEY) is not None
+        assert await redis_client.get(KEY) is None
+
+        # The key expired and another worker took it, leaving must not delete its lock
+        async with lock.hold("s1"):
+            await redis_client.set(KEY, "other-holder")
+        return await redis_client.get(KEY)
+
+    assert asyncio.run(scenario()) == b"other-holder"
+
+
+def test_held_lock_is_extended():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        lock = SessionLock(redis_client, ttl_ms=300, timeout=1)
+
+        async with lock.hold("s1"):
+            # Well past the ttl, the holder keeps extending it
+            await asyncio.sleep(0.7)
+            ttl = await redis_client.pttl(KEY)
+        return ttl
+
+    assert asyncio.run(scenario()) > 0
+
+
+def test_extend_leaves_other_holders_alone():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        lock = SessionLock(redis_client, ttl_ms=300, timeout=1)
+
+        async with lock.hold("s1"):
+            await redis_client.set(KEY, "other-holder", px=5000)
+            await asyncio.sleep(0.25)
+            return await redis_client.pttl(KEY)
+
+    # pexpire to 300ms would have shortened the other holder's lock
+    assert asyncio.run(scenario()) > 4000
+
+
+def test_same_session_waits_for_the_holder():
+    async def scenario():
+        lock = SessionLock(FakeAsyncRedis(), ttl_ms=1000, timeout=1)
+        events = []
+
+        async def request(name: str):
+            async with lock.hold("s1"):
+                events.append(f"{name} start")
+                await asyncio.sleep(0.05)
+                events.append(f"{name} end")
+
+        await asyncio.gather(request("first"), request("second"))
+        return events
+
+    assert asyncio.run(scenario()) == ["first start", "first end", "second start", "second end"]
+
+
+def test_times_out_when_another_worker_holds_it():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        await redis_client.set(KEY, "other-worker", px=5000)
+        async with SessionLock(redis_client, ttl_ms=1000, timeout=0.2).hold("s1"):
+            pass
+
+    with pytest.raises(SessionLockTimeout):
+        asyncio.run(scenario())
+
+
+def test_falls_back_to_the_local_lock_without_redis():
+    async def scenario():
+        server = FakeServer()
+        server.connected = False
+        lock = SessionLock(FakeAsyncRedis(server=server), ttl_ms=1000, timeout=1)
+        running = []
+        overlaps = []
+
+        async def request():
+            async with lock.hold("s1"):
+                overlaps.append(len(running))
+                running.append(1)
+                await asyncio.sleep(0.02)
+                running.pop()
+
+        await asyncio.gather(*[request() for _ in range(3)])
+        return overlaps
+
+    # Requests still run, one at a time within the worker
+    assert asyncio.run(scenario()) == [0, 0, 0]
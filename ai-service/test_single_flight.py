@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight, jittered_ttl
+
+
+class Loader:
+    """Counts its calls, each one waits until released"""
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return f"result {self.calls}"
+
+
+def test_concurrent_calls_share_one_load():
+    async def scenario():
+        flights = SingleFlight("test")
+        loader = Loader()
+        callers = [asyncio.create_task(flights.do("key", loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flights.in_flight("key")
+        loader.release.set()
+        results = await asyncio.gather(*callers)
+
+        # Nothing is kept once the load is done, the next call loads again
+        assert not flights.in_flight("key")
+        assert await flights.do("key", loader) == "result 2"
+        return results, loader.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == ["result 1"] * 5
+    assert calls == 2
+
+
+def test_different_keys_load_separately():
+    async def scenario():
+        flights = SingleFlight("test")
+        loader = Loader()
+        loader.release.set()
+        return await asyncio.gather(flights.do("a", loader), flights.do("b", loader)), loader.calls
+
+    _, calls = asyncio.run(scenario())
+    assert calls == 2
+
+
+def test_error_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight("test")
+        loader = Loader(RuntimeError("search down"))
+        callers = [asyncio.create_task(flights.do("key", loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+
+        # A failed load is not remembered either
+        loader.error = None
+        return results, await flights.do("key", loader)
+
+    results, retried = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["search down"] * 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried == "result 2"
+
+
+def test_cancelled_caller_leaves_the_load_running():
+    async def scenario():
+        flights = SingleFlight("test")
+        loader = Loader()
+        first = asyncio.create_task(flights.do("key", loader))
+        second = asyncio.create_task(flights.do("key", loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        loader.release.set()
+        return first.cancelled(), await second, loader.calls
+
+    assert asyncio.run(scenario()) == (True, "result 1", 1)
+
+
+@pytest.mark.parametrize("ttl", [1, 30, 3600])
+def test_jittered_ttl_stays_within_the_jitter(ttl):
+    values = {jittered_ttl(ttl) for _ in range(200)}
+    assert min(values) >= max(1, int(ttl * 0.9)) and max(values) <= ttl * 1.1
+    if ttl >= 100:
+        assert len(values) > 1
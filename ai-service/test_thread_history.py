@@ -0,0 +1,132 @@
+import asyncio
+import base64
+import json
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from thread_history import InvalidCursor, decode_cursor, encode_cursor, read_page, stream_messages
+
+
+START = datetime(2025, 6, 1, 10, 0, 0)
+
+
+def make_collection(count: int, ties: int = 1):
+    """count messages of thread_1, ties messages share each timestamp so pages must break ties on _id"""
+    collection = AsyncMongoMockClient()["AI-service"]["Messages"]
+    docs = [
+        {
+            "_id": ObjectId(),
+            "thread_id": "thread_1",
+            "role": "USER" if i % 2 == 0 else "ASSISTANT",
+            "content": f"message {i}",
+            "timestamp": START + timedelta(milliseconds=i // ties)
+        }
+        for i in range(count)
+    ]
+    if docs:
+        asyncio.run(collection.insert_many(docs))
+    return collection, docs
+
+
+async def read_all_pages(collection, limit: int, newest_first: bool, roles: list = None) -> tuple[list, int]:
+    ids, pages, cursor = [], 0, None
+    while True:
+        page = await read_page(collection, "thread_1", roles or [], cursor, limit, newest_first)
+        ids += [message["id"] for message in page["messages"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+# -------------------------------------------------------------Cursors------------------------------------------------------------
+
+def test_cursor_round_trip():
+    doc = {"_id": ObjectId(), "timestamp": START + timedelta(microseconds=123000)}
+    cursor = encode_cursor(doc)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (doc["timestamp"], doc["_id"])
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(json.dumps({"t": START.isoformat()}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"t": "yesterday", "id": str(ObjectId())}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"t": START.isoformat(), "id": "nope"}).encode()).decode(),
+])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+# -------------------------------------------------------------Pages------------------------------------------------------------
+
+@pytest.mark.parametrize("newest_first", [False, True])
+@pytest.mark.parametrize("count, limit, ties", [(7, 2, 1), (8, 2, 3), (6, 3, 6), (1, 5, 1)])
+def test_pages_cover_every_message_once(newest_first, count, limit, ties):
+    collection, docs = make_collection(count, ties)
+    expected = [str(doc["_id"]) for doc in sorted(docs, key=lambda doc: (doc["timestamp"], doc["_id"]), reverse=newest_first)]
+
+    ids, pages = asyncio.run(read_all_pages(collection, limit, newest_first))
+    assert ids == expected
+    # A last page that is exactly full has no next cursor, no empty page is served
+    assert pages == -(-count // limit)
+
+
+def test_empty_thread_has_no_next_page():
+    collection, _ = make_collection(0)
+    page = asyncio.run(read_page(collection, "thread_1", [], None, 10, False))
+    assert page == {"messages": [], "next_cursor": None}
+
+
+def test_role_filter():
+    collection, docs = make_collection(6)
+    ids, _ = asyncio.run(read_all_pages(collection, 2, False, roles=["ASSISTANT"]))
+    assert ids == [str(doc["_id"]) for doc in docs if doc["role"] == "ASSISTANT"]
+
+
+def test_messages_saved_meanwhile_do_not_shift_pages():
+    collection, docs = make_collection(4)
+
+    async def scenario():
+        first = await read_page(collection, "thread_1", [], None, 2, False)
+        await collection.insert_one({
+            "_id": ObjectId(), "thread_id": "thread_1", "role": "USER", "content": "late", "timestamp": START + timedelta(seconds=1)
+        })
+        second = await read_page(collection, "thread_1", [], first["next_cursor"], 2, False)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [message["id"] for message in first["messages"] + second["messages"]] == [str(doc["_id"]) for doc in docs]
+    assert second["next_cursor"] is not None
+
+
+# -------------------------------------------------------------Streaming------------------------------------------------------------
+
+def test_stream_stops_at_limit_with_a_resumable_cursor():
+    collection, docs = make_collection(5, ties=2)
+
+    async def scenario():
+        lines = [json.loads(line) async for line in stream_messages(collection, "thread_1", [], None, 3, False, batch_size=2)]
+        rest = [json.loads(line) async for line in stream_messages(collection, "thread_1", [], lines[-1]["next_cursor"], 0, False, batch_size=2)]
+        return lines, rest
+
+    lines, rest = asyncio.run(scenario())
+    assert len(lines) == 4 and "next_cursor" in lines[-1]
+    assert [line["id"] for line in lines[:-1] + rest] == [str(doc["_id"]) for doc in docs]
+
+
+def test_stream_without_limit_has_no_cursor_line():
+    collection, docs = make_collection(3)
+
+    async def scenario():
+        return [json.loads(line) async for line in stream_messages(collection, "thread_1", [], None, 0, True, batch_size=2)]
+
+    lines = asyncio.run(scenario())
+    assert [line["id"] for line in lines] == [str(doc["_id"]) for doc in reversed(docs)]
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from semantic_kernel.connectors.ai import FunctionChoiceBehavior
+from semantic_kernel.contents import ChatHistory, FunctionCallContent
+from semantic_kernel.filters import FilterTypes
+from semantic_kernel.functions import kernel_function
+from semantic_kernel.kernel import Kernel
+
+import travelAgent
+from travelAgent import tool_call_filter
+
+
+class SlowPlugin:
+    """Sleeps for the requested time and records how many calls run at once"""
+    def __init__(self):
+        self.running = 0
+        self.most_running = 0
+        self.finished = []
+
+    @kernel_function(description="Sleeps for the given number of seconds")
+    async def sleep(self, seconds: float) -> str:
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.running -= 1
+        self.finished.append(seconds)
+        return f"slept {seconds}"
+
+
+@pytest.fixture
+def plugin(monkeypatch) -> SlowPlugin:
+    monkeypatch.setattr(travelAgent, "tool_call_concurrency", 2)
+    monkeypatch.setattr(travelAgent, "tool_call_timeout", 0.3)
+    return SlowPlugin()
+
+
+def make_kernel(plugin: SlowPlugin) -> Kernel:
+    kernel = Kernel()
+    kernel.add_filter(FilterTypes.AUTO_FUNCTION_INVOCATION, tool_call_filter)
+    kernel.add_plugin(plugin, "SlowPlugin")
+    return kernel
+
+
+async def respond(kernel: Kernel, history: ChatHistory, *seconds: float, request_index: int = 0) -> list:
+    """Run the tool calls of one model response the way the agent does, all at once, and return their results"""
+    calls = [
+        FunctionCallContent(id=f"call_{request_index}_{i}", name="SlowPlugin-sleep", arguments=json.dumps({"seconds": value}))
+        for i, value in enumerate(seconds)
+    ]
+    await asyncio.gather(*[
+        kernel.invoke_function_call(
+            function_call=call,
+            chat_history=history,
+            function_call_count=len(calls),
+            request_index=request_index,
+            function_behavior=FunctionChoiceBehavior.Auto()
+        )
+        for call in calls
+    ])
+    results = {item.id: str(item.result) for message in history.messages for item in message.items}
+    return [results[call.id] for call in calls]
+
+
+def test_concurrency_stays_within_the_limit(plugin):
+    async def scenario():
+        return await respond(make_kernel(plugin), ChatHistory(), 0.05, 0.05, 0.05, 0.05, 0.05)
+
+    results = asyncio.run(scenario())
+    assert results == ["slept 0.05"] * 5
+    assert plugin.most_running == 2
+
+
+def test_limit_is_per_model_response(plugin):
+    async def scenario():
+        kernel = make_kernel(plugin)
+        # Two conversations and a second model request of the first, each gets its own slots
+        await asyncio.gather(
+            respond(kernel, ChatHistory(), 0.1, 0.1),
+            respond(kernel, ChatHistory(), 0.1, 0.1),
+            respond(kernel, ChatHistory(), 0.1, 0.1, request_index=1)
+        )
+
+    asyncio.run(scenario())
+    assert plugin.most_running == 6
+
+
+def test_slow_call_answers_with_the_fallback(plugin):
+    async def scenario():
+        return await respond(make_kernel(plugin), ChatHistory(), 0.05, 5)
+
+    results = asyncio.run(scenario())
+    assert results == ["slept 0.05", "sleep did not respond in time, answer without it."]
+    # The slow call was cancelled, not left running
+    assert plugin.finished == [0.05] and plugin.running == 0
+
+
+def test_waiting_for_a_slot_counts_towards_the_timeout(plugin):
+    async def scenario():
+        return await respond(make_kernel(plugin), ChatHistory(), 0.2, 0.2, 0.2)
+
+    # The third call waits 0.2s for a slot and would finish at 0.4s, past the 0.3s timeout
+    assert asyncio.run(scenario()) == ["slept 0.2", "slept 0.2", "sleep did not respond in time, answer without it."]
+
+
+def test_limits_are_dropped_after_the_response(plugin):
+    async def scenario():
+        kernel = make_kernel(plugin)
+        history = ChatHistory()
+        await respond(kernel, history, 0.01, 0.01, 0.01)
+        await respond(kernel, history, 0.01, 5, request_index=1)
+
+    asyncio.run(scenario())
+    assert travelAgent.tool_call_limits == {}
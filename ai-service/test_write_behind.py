@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+
+from datetime import datetime, timedelta, UTC
+
+from fakeredis import FakeAsyncRedis
+from mongomock_motor import AsyncMongoMockClient
+
+from write_behind import WriteBehindQueue
+
+
+START = datetime(2025, 6, 1, 10, 0, 0, tzinfo=UTC)
+seconds = itertools.count()
+
+
+class ThreadsCollection:
+    """mongomock's bulk_write does not accept the UpdateOne of current pymongo, apply them one by one"""
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            await self.collection.update_one(operation._filter, operation._doc, upsert=operation._upsert)
+
+    async def find_one(self, *args, **kwargs):
+        return await self.collection.find_one(*args, **kwargs)
+
+
+def make_queue(redis_client=None, **kwargs) -> WriteBehindQueue:
+    db = AsyncMongoMockClient()["AI-service"]
+    return WriteBehindQueue(
+        redis_client or FakeAsyncRedis(),
+        ThreadsCollection(db["Threads"]),
+        db["Messages"],
+        block_ms=10,
+        **kwargs
+    )
+
+
+def make_entry(session_id: str, msg_count: int, contents: list) -> dict:
+    msg_docs = [
+        {"thread_id": f"thread_{session_id}", "role": "USER", "content": content, "items": [], "timestamp": START + timedelta(seconds=next(seconds))}
+        for content in contents
+    ]
+    return WriteBehindQueue.build_entry(session_id, f"thread_{session_id}", msg_count, msg_docs)
+
+
+async def enqueue(queue: WriteBehindQueue, *entries):
+    async with queue.redis_client.pipeline(transaction=True) as pipe:
+        for entry in entries:
+            queue.add_to_pipeline(pipe, entry)
+        await pipe.execute()
+
+
+async def stored(queue: WriteBehindQueue, session_id: str) -> tuple[list, dict]:
+    contents = [doc["content"] async for doc in queue.msg_collection.find({"thread_id": f"thread_{session_id}"}).sort("timestamp", 1)]
+    thread = await queue.threads_collection.find_one({"session_id": session_id}, {"_id": 0, "msg_count": 1, "thread_id": 1})
+    return contents, thread
+
+
+def test_stop_flushes_queued_entries():
+    async def scenario():
+        queue = make_queue()
+        await queue.start()
+        # Queued while the worker is mid-read and right before shutdown
+        await enqueue(queue, make_entry("s1", 2, ["hi", "hello"]))
+        await enqueue(queue, make_entry("s1", 4, ["bye", "goodbye"]))
+        await queue.stop()
+        return await stored(queue, "s1"), await queue.redis_client.xlen(queue.stream)
+
+    (contents, thread), left = asyncio.run(scenario())
+    assert contents == ["hi", "hello", "bye", "goodbye"]
+    assert thread == {"thread_id": "thread_s1", "msg_count": 4}
+    assert left == 0
+
+
+def test_replayed_entries_do_not_duplicate_messages():
+    async def scenario():
+        queue = make_queue()
+        await queue.start()
+        entry = make_entry("s1", 2, ["hi", "hello"])
+        await enqueue(queue, entry)
+        await queue.flush()
+        # The same payload again, as after a crash between the insert and the acknowledgement
+        await enqueue(queue, entry)
+        await queue.stop()
+        return await stored(queue, "s1")
+
+    contents, thread = asyncio.run(scenario())
+    assert contents == ["hi", "hello"]
+    assert thread["msg_count"] == 2
+
+
+def test_msg_count_keeps_the_highest_value():
+    async def scenario():
+        queue = make_queue()
+        await queue.start()
+        # Out of order within one batch, then an older count in a later batch
+        await enqueue(queue, make_entry("s1", 4, ["c", "d"]), make_entry("s1", 2, ["a", "b"]))
+        await queue.flush()
+        await enqueue(queue, make_entry("s1", 3, ["e"]))
+        await queue.stop()
+        return await stored(queue, "s1")
+
+    _, thread = asyncio.run(scenario())
+    assert thread["msg_count"] == 4
+
+
+def test_entries_of_a_dead_worker_are_reclaimed():
+    async def scenario():
+        redis_client = FakeAsyncRedis()
+        dead = make_queue(redis_client)
+        dead.consumer = "dead-worker"
+        await dead.start()
+        await dead.stop()
+
+        # Delivered to the dead worker, never acknowledged
+        await enqueue(dead, make_entry("s1", 2, ["hi", "hello"]))
+        assert await dead._read(block_ms=None)
+
+        alive = make_queue(redis_client, retry_idle_ms=50)
+        alive.msg_collection, alive.threads_collection = dead.msg_collection, dead.threads_collection
+        await alive.start()
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            contents, _ = await stored(alive, "s1")
+            if contents:
+                break
+        await alive.stop()
+        pending = await redis_client.xpending(alive.stream, alive.group)
+        return contents, pending["pending"]
+
+    contents, pending = asyncio.run(scenario())
+    assert contents == ["hi", "hello"]
+    assert pending == 0
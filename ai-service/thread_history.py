@@ -0,0 +1,110 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Keyset pagination over a thread's messages for GET /threads/{session_id}/messages.
+# Pages continue from the (timestamp, _id) of the last message returned instead of skipping,
+# so page N costs the same as page 1 and messages saved meanwhile never shift a page.
+
+import base64
+import json
+
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+
+HISTORY_PROJECTION = {"_id": 1, "role": 1, "content": 1, "timestamp": 1}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor pointing just past doc in the current order"""
+    raw = json.dumps({"t": doc["timestamp"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        return datetime.fromisoformat(position["t"]), ObjectId(position["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def history_query(thread_id: str, roles: list, cursor: Optional[str], newest_first: bool) -> dict:
+    """Messages of the thread after the cursor, served by the thread_timestamp_id index"""
+    query = {"thread_id": thread_id}
+    if roles:
+        query["role"] = {"$in": roles}
+    if cursor:
+        timestamp, last_id = decode_cursor(cursor)
+        after = "$lt" if newest_first else "$gt"
+        query["$or"] = [
+            {"timestamp": {after: timestamp}},
+            {"timestamp": timestamp, "_id": {after: last_id}}
+        ]
+    return query
+
+
+def history_sort(newest_first: bool) -> list:
+    direction = DESCENDING if newest_first else ASCENDING
+    return [("timestamp", direction), ("_id", direction)]
+
+
+def to_message(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "role": doc["role"],
+        "content": doc.get("content", ""),
+        "timestamp": doc["timestamp"].isoformat()
+    }
+
+
+async def read_page(msg_collection, thread_id: str, roles: list, cursor: Optional[str], limit: int, newest_first: bool) -> dict:
+    """One page of messages and the cursor of the next one, None when this is the last page"""
+    docs = await msg_collection.find(
+        history_query(thread_id, roles, cursor, newest_first),
+        HISTORY_PROJECTION
+    ).sort(history_sort(newest_first)).limit(limit + 1).to_list(length=limit + 1)
+
+    # One extra document tells whether another page exists without a count query
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return {
+        "messages": [to_message(doc) for doc in docs],
+        "next_cursor": encode_cursor(docs[-1]) if has_more else None
+    }
+
+
+async def stream_messages(msg_collection, thread_id: str, roles: list, cursor: Optional[str], limit: int, newest_first: bool, batch_size: int) -> AsyncIterator[str]:
+    """
+    NDJSON lines of the thread's messages read through one MongoDB cursor, batch_size documents per round-trip,
+    so neither side holds the conversation in memory. When limit stops the stream early,
+    the last line is {"next_cursor": ...} to resume from
+    """
+    mongo_cursor = msg_collection.find(
+        history_query(thread_id, roles, cursor, newest_first),
+        HISTORY_PROJECTION,
+        batch_size=batch_size
+    ).sort(history_sort(newest_first))
+    if limit:
+        mongo_cursor = mongo_cursor.limit(limit + 1)
+
+    try:
+        sent = 0
+        last_doc = None
+        async for doc in mongo_cursor:
+            if limit and sent == limit:
+                yield json.dumps({"next_cursor": encode_cursor(last_doc)}) + "\n"
+                break
+            yield json.dumps(to_message(doc)) + "\n"
+            last_doc = doc
+            sent += 1
+    finally:
+        # The client may stop reading at any point, release the server-side cursor
+        await mongo_cursor.close()
@@ -3,7 +3,10 @@
 
 import os 
 import random
+import logging
 import asyncio
+import hashlib
+import time
 
 from typing import Annotated, List
 from openai import AsyncAzureOpenAI
@@ -14,39 +17,96 @@ from semantic_kernel.kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureChatPromptExecutionSettings
 from semantic_kernel.agents import ChatCompletionAgent, ChatHistoryAgentThread
 from semantic_kernel.connectors.ai import FunctionChoiceBehavior
-from semantic_kernel.functions import KernelArguments, kernel_function
+from semantic_kernel.functions import FunctionResult, KernelArguments, kernel_function
+from semantic_kernel.filters import AutoFunctionInvocationContext, FilterTypes, FunctionInvocationContext
 
 
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents.indexes.models import SearchIndex, SimpleField, SearchFieldDataType, SearchableField
 from azure.identity import DefaultAzureCredential, InteractiveBrowserCredential
 
+import plugins.plugin_functions as plugin_functions
+import plugins.destination_catalog as destination_catalog
 from plugins.plugin_functions import DestinationsPlugin, PromptPlugin, WeatherInfoPlugin
+from retrieval_cache import RetrievalCache
+from index_bootstrap import bootstrap_index, corpus_version, documents, index_name
+from retrievers import Retriever, create_retriever
+from clients import create_openai_client
+from metrics import PLUGIN_LATENCY, TOOL_CALL_TIMEOUTS, record_stage
 
 from pydantic import BaseModel, ValidationError, Field
 
 
+logger = logging.getLogger(__name__)
+
+
 # -------------------------------------------------------------Create the client and kernel------------------------------------------------------------
 
 # Loads the .env file and connects to Azure OpenAI endpoint 
 load_dotenv()
 
-# Initializes Semantic Kernel 
-kernel = Kernel()
-
-# Creates and registers Azure OpenAI as the AI model in your kernel.
+# Azure OpenAI is registered in the kernel under this service id
 service_id = "agent"
 
-chat_completion_service = AzureChatCompletion(
-    deployment_name="gpt-4o",
-    endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
-    api_version=os.environ.get("AZURE_OPENAI_API_VERSION"),
-    service_id=service_id
-)
-kernel.add_service(chat_completion_service)
+
+# Times every plugin function the agent invokes, per function in Prometheus and as one "plugins" stage per request
+async def plugin_timing_filter(context: FunctionInvocationContext, next):
+    start = time.perf_counter()
+    try:
+        await next(context)
+    finally:
+        elapsed = time.perf_counter() - start
+        PLUGIN_LATENCY.labels(plugin=context.function.plugin_name or "", function=context.function.name).observe(elapsed)
+        record_stage("plugins", elapsed)
+
+
+# The tool calls of one model response run concurrently, at most TOOL_CALL_CONCURRENCY of them at once,
+# and each is cut off TOOL_CALL_TIMEOUT seconds after it was requested, waiting for a slot included.
+# A response waits for its slowest call instead of the sum of them, and never for the calls of other requests
+tool_call_concurrency = int(os.getenv("TOOL_CALL_CONCURRENCY", 8))
+tool_call_timeout = float(os.getenv("TOOL_CALL_TIMEOUT", 10))
+
+# (chat history, model request) -> [semaphore, calls in flight], dropped when its last call is done
+tool_call_limits = {}
+
+
+async def tool_call_filter(context: AutoFunctionInvocationContext, next):
+    key = (id(context.chat_history), context.request_sequence_index)
+    limit = tool_call_limits.setdefault(key, [asyncio.Semaphore(tool_call_concurrency), 0])
+    limit[1] += 1
+
+    async def invoke():
+        async with limit[0]:
+            await next(context)
+
+    try:
+        await asyncio.wait_for(invoke(), timeout=tool_call_timeout)
+    except asyncio.TimeoutError:
+        plugin_name = context.function.plugin_name or ""
+        TOOL_CALL_TIMEOUTS.labels(plugin=plugin_name, function=context.function.name).inc()
+        logger.warning("Tool call %s.%s timed out after %.1fs", plugin_name, context.function.name, tool_call_timeout)
+        # The model gets an answer it can work with instead of the whole turn failing
+        context.function_result = FunctionResult(
+            function=context.function.metadata,
+            value=f"{context.function.name} did not respond in time, answer without it."
+        )
+    finally:
+        limit[1] -= 1
+        if limit[1] == 0:
+            tool_call_limits.pop(key, None)
+
+
+def create_kernel() -> Kernel:
+    """Initializes Semantic Kernel with Azure OpenAI as the AI model"""
+    kernel = Kernel()
+
+    # The OpenAI client carries the tuned HTTP pool (keep-alive, HTTP/2, timeouts) from clients.py
+    kernel.add_service(AzureChatCompletion(
+        deployment_name="gpt-4o",
+        async_client=create_openai_client(),
+        service_id=service_id
+    ))
+    kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, plugin_timing_filter)
+    kernel.add_filter(FilterTypes.AUTO_FUNCTION_INVOCATION, tool_call_filter)
+    return kernel
 
 
 #-------------------------------------------------------------Multi Agents Set Up------------------------------------------------------------
@@ -67,16 +127,6 @@ class TravelPlan(BaseModel):
 
 # -------------------------------------------------------------Creating the Agent------------------------------------------------------------
 
-# Configures how the agent responds (creative, varied, and auto-chooses functions when needed).
-settings = kernel.get_prompt_execution_settings_from_service_id(service_id=service_id)
-assert isinstance(settings, AzureChatPromptExecutionSettings)
-# settings.response_format = TravelPlan
-settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
-#settings.max_tokens = 1000  # Increase max tokens for longer responses
-#settings.temperature = 0.7  # Add some creativity to responses
-#settings.top_p = 0.9  # Add top_p for better sampling
-#settings.presence_penalty = 0.1  # Add presence penalty to encourage diversity
-
 # Defines the behavior and formatting instructions of the AI agent.
 AGENT_NAME = "TravelAgent"
 AGENT_INSTRUCTIONS = """You are an planner agent.
@@ -94,79 +144,109 @@ AGENT_INSTRUCTIONS = """You are an planner agent.
     If context is provided, do not say 'I have no context for that.'
 """
 
-# Combines the kernel, model, and instructions to create your AI travel agent.
-agent = ChatCompletionAgent(
-    kernel=kernel,
-    name=AGENT_NAME,
-    instructions=AGENT_INSTRUCTIONS,
-    arguments=KernelArguments(settings=settings),
-    plugins=[DestinationsPlugin(), PromptPlugin(), WeatherInfoPlugin()]
-)
-
-
-# -------------------------------------------------------------Creating the Agent------------------------------------------------------------
-
-# Initialize Azure AI Search wtih persistent storage
-search_service_endpoint = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
-search_api_key = os.getenv("AZURE_SEARCH_API_KEY")
-index_name = "travel-documents"
-
-search_client = SearchClient(
-    endpoint=search_service_endpoint,
-    index_name=index_name,
-    credential=AzureKeyCredential(search_api_key)
-)
-
-index_client = SearchIndexClient(
-    endpoint=search_service_endpoint,
-    credential=AzureKeyCredential(search_api_key)
-)
-
-# Define the index schema -> A record
-fields = [
-    # Consist of an id and content
-    SimpleField(name="id", type=SearchFieldDataType.String, key=True),
-    SearchableField(name="content", type=SearchFieldDataType.String)
-]
-
-# A table(schema)
-index = SearchIndex(name=index_name, fields=fields)
-
-# Check if index already exists if not, create it
-try:
-    existing_index = index_client.get_index(index_name)
-    print(f"Index '{index_name}' already exists, using the existing index.")
-except Exception as e:
-    # Create the index if it doesn't exist
-    print(f"Creating new index '{index_name}'...")
-    index_client.create_index(index)
-
-# Enhanced sample documents
-documents = [
-    {"id": "1", "content": "Contoso Travel offers luxury vacation packages to exotic destinations worldwide."},
-    {"id": "2", "content": "Our premium travel services include personalized itinerary planning and 24/7 concierge support."},
-    {"id": "3", "content": "Contoso's travel insurance covers medical emergencies, trip cancellations, and lost baggage."},
-    {"id": "4", "content": "Popular destinations include the Maldives, Swiss Alps, and African safaris."},
-    {"id": "5", "content": "Contoso Travel provides exclusive access to boutique hotels and private guided tours."}
-]
-
-# Add documents to the index
-search_client.upload_documents(documents)
-
-def get_retrieval_context(query: str) -> str:
-    results = search_client.search(query)
+def create_agent(kernel: Kernel) -> ChatCompletionAgent:
+    # Configures how the agent responds (creative, varied, and auto-chooses functions when needed).
+    settings = kernel.get_prompt_execution_settings_from_service_id(service_id=service_id)
+    assert isinstance(settings, AzureChatPromptExecutionSettings)
+    # settings.response_format = TravelPlan
+    settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
+    #settings.max_tokens = 1000  # Increase max tokens for longer responses
+    #settings.temperature = 0.7  # Add some creativity to responses
+    #settings.top_p = 0.9  # Add top_p for better sampling
+    #settings.presence_penalty = 0.1  # Add presence penalty to encourage diversity
+
+    # Combines the kernel, model, and instructions to create your AI travel agent.
+    return ChatCompletionAgent(
+        kernel=kernel,
+        name=AGENT_NAME,
+        instructions=AGENT_INSTRUCTIONS,
+        arguments=KernelArguments(settings=settings),
+        plugins=[DestinationsPlugin(), PromptPlugin(), WeatherInfoPlugin()]
+    )
+
+
+# Hash of the plugin code and data, cached replies are keyed on it so they expire when plugin answers change
+plugin_hash = hashlib.sha256()
+for plugin_path in (plugin_functions.__file__, destination_catalog.__file__, destination_catalog.catalog_path()):
+    with open(plugin_path, "rb") as plugin_file:
+        plugin_hash.update(plugin_file.read())
+plugin_fingerprint = plugin_hash.hexdigest()[:16]
+
+
+# -------------------------------------------------------------Retrieval------------------------------------------------------------
+
+retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", 50))
+
+
+def create_retrieval() -> tuple[Retriever, RetrievalCache]:
+    """
+    Retrieval engine behind get_retrieval_context: azure (default), bm25 or azure_with_fallback.
+    The Azure index itself is created and filled by index_bootstrap, outside the import path
+    """
+    retriever = create_retriever(
+        kind=os.getenv("RETRIEVER", "azure"),
+        documents=documents,
+        index_name=index_name,
+        version=corpus_version
+    )
+
+    # Retrieval results are cached per index version, a re-upload with different documents starts a new namespace
+    retrieval_cache = RetrievalCache(
+        index_name=index_name,
+        version=f"{corpus_version}:{retriever.name}",
+        max_size=int(os.getenv("RETRIEVAL_CACHE_SIZE", 1024)),
+        local_ttl=int(os.getenv("RETRIEVAL_CACHE_TTL", 300)),
+        redis_ttl=int(os.getenv("RETRIEVAL_CACHE_REDIS_TTL", 3600)),
+        refresh_ahead=float(os.getenv("RETRIEVAL_CACHE_REFRESH_AHEAD", 0.1)),
+        fallback_ttl=int(os.getenv("RETRIEVAL_CACHE_FALLBACK_TTL", 30))
+    )
+    return retriever, retrieval_cache
+
+
+# -------------------------------------------------------------Worker State------------------------------------------------------------
+
+# Created per worker process by init_agent(), never at import, so a pre-forking server does not share
+# HTTP connections or event-loop bound clients between workers
+kernel = None
+chat_completion_service = None
+agent = None
+retriever = None
+retrieval_cache = None
+
+
+def init_agent():
+    global kernel, chat_completion_service, agent, retriever, retrieval_cache
+    if agent is not None:
+        return
+
+    kernel = create_kernel()
+    chat_completion_service = kernel.get_service(service_id)
+    agent = create_agent(kernel)
+    retriever, retrieval_cache = create_retrieval()
+
+
+async def search_retrieval_context(query: str) -> str:
+    results = await retriever.search(query, top_k=retrieval_top_k)
     context_strings = []
-    for result in results:
-        context_strings.append(f"Document: {result['content']}")
+    for content in results:
+        context_strings.append(f"Document: {content}")
     return "\n\n".join(context_strings) if context_strings else "No results found"
 
+async def get_retrieval_context(query: str) -> str:
+    return await retrieval_cache.get_or_fetch(query, search_retrieval_context)
+
 async def get_augmented_prompt(query: str) -> str:
-    retrieval_context = get_retrieval_context(query)
+    retrieval_context = await get_retrieval_context(query)
     return PromptPlugin.build_augmented_prompt(query, retrieval_context)
 
 # -------------------------------------------------------------Running the Agent------------------------------------------------------------
 
 async def main():
+    init_agent()
+
+    # Make sure the index holds the current documents
+    await bootstrap_index()
+
     # Create a thread for the conversation
     thread = ChatHistoryAgentThread()
 
@@ -0,0 +1,206 @@
+# -------------------------------------------------------------IMPORT------------------------------------------------------------
+# Write-behind persistence for chat messages (PERSISTENCE_MODE=write_behind).
+# save_thread queues new messages on a Redis Stream in the same MULTI that updates the thread cache and returns,
+# a background worker per process drains the stream into MongoDB in batches.
+
+import logging
+import os
+import json
+import socket
+import asyncio
+
+from datetime import datetime, UTC
+from typing import List
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from redis.exceptions import ResponseError
+
+
+logger = logging.getLogger(__name__)
+
+
+""" Queue entry structure
+persist_queue  (Redis Stream, field "payload")
+{
+    "session_id": "abc123",
+    "thread_id": "thread_xyz",
+    "msg_count": 27,
+    "messages": [
+        {"_id": "ObjectId hex", "thread_id": "...", "role": "USER", "content": "...", "items": [], "timestamp": "ISO"}
+    ]
+}
+"""
+
+
+class WriteBehindQueue:
+    """
+    Durable queue of message writes backed by a Redis Stream and a consumer group.
+    - Ordering: message timestamps and ids are assigned when queued, so reads sorted by timestamp keep each thread
+      in order no matter which worker inserts a batch; within a batch entries are written in stream order
+    - Retry: an entry is acknowledged only after MongoDB accepted it, failed entries stay pending and are reclaimed
+      after retry_idle_ms. Messages carry their ObjectId, so a retried insert skips what already landed
+    - Shutdown: stop() drains everything this worker can still read before returning
+    """
+    def __init__(
+        self,
+        redis_client,
+        threads_collection,
+        msg_collection,
+        stream: str = "persist_queue",
+        group: str = "ai-service",
+        batch_size: int = 200,
+        block_ms: int = 1000,
+        retry_idle_ms: int = 30000,
+    ):
+        self.redis_client = redis_client
+        self.threads_collection = threads_collection
+        self.msg_collection = msg_collection
+        self.stream = stream
+        self.group = group
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.retry_idle_ms = retry_idle_ms
+        self._stopping = asyncio.Event()
+        self._worker = None
+
+    # ---------------------------------------------------Producer---------------------------------------------------
+
+    @staticmethod
+    def build_entry(session_id: str, thread_id: str, msg_count: int, msg_docs: List[dict]) -> dict:
+        """Stream fields for a save, msg_docs are the serialized messages of save_thread"""
+        messages = []
+        for msg_doc in msg_docs:
+            messages.append({
+                **msg_doc,
+                "_id": str(ObjectId()),
+                "timestamp": msg_doc["timestamp"].isoformat()
+            })
+
+        payload = {
+            "session_id": session_id,
+            "thread_id": thread_id,
+            "msg_count": msg_count,
+            "messages": messages
+        }
+        return {"payload": json.dumps(payload)}
+
+    def add_to_pipeline(self, pipe, entry: dict):
+        """Queue the entry as part of the caller's Redis transaction"""
+        pipe.xadd(self.stream, entry)
+
+    # ---------------------------------------------------Worker---------------------------------------------------
+
+    async def start(self):
+        try:
+            await self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._stopping.clear()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker and flush what is left in the stream"""
+        self._stopping.set()
+        if self._worker:
+            await self._worker
+            self._worker = None
+        await self.flush()
+
+    async def flush(self):
+        """Drain pending and new entries without blocking, used on shutdown"""
+        while True:
+            entries = await self._read(pending=True) + await self._read(block_ms=None)
+            if not entries:
+                return
+            await self._process(entries)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                entries = await self._reclaim() + await self._read(block_ms=self.block_ms)
+                if entries:
+                    await self._process(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Write-behind batch failed, will retry: %s", e)
+                await asyncio.sleep(1)
+
+    async def _read(self, block_ms=None, pending: bool = False) -> list:
+        # ">" reads entries never delivered to the group, "0" re-reads this consumer's unacknowledged ones
+        response = await self.redis_client.xreadgroup(
+            self.group,
+            self.consumer,
+            {self.stream: "0" if pending else ">"},
+            count=self.batch_size,
+            block=block_ms
+        )
+        if not response:
+            return []
+        return response[0][1]
+
+    async def _reclaim(self) -> list:
+        """Take over entries another (possibly dead) worker failed to acknowledge in time"""
+        response = await self.redis_client.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer,
+            min_idle_time=self.retry_idle_ms,
+            start_id="0-0",
+            count=self.batch_size
+        )
+        return response[1]
+
+    async def _process(self, entries: list):
+        msg_docs = []
+        thread_updates = {}
+
+        for _, fields in entries:
+            # Entries deleted from the stream come back without fields, they only need acknowledging
+            if not fields:
+                continue
+            payload = json.loads(fields[b"payload"].decode("utf-8"))
+            for message in payload["messages"]:
+                msg_docs.append({
+                    **message,
+                    "_id": ObjectId(message["_id"]),
+                    "timestamp": datetime.fromisoformat(message["timestamp"])
+                })
+
+            # Keep the highest count per session, $max makes replays and out-of-order batches harmless
+            session_id = payload["session_id"]
+            previous = thread_updates.get(session_id)
+            if previous is None or payload["msg_count"] > previous["msg_count"]:
+                thread_updates[session_id] = payload
+
+        if msg_docs:
+            try:
+                await self.msg_collection.insert_many(msg_docs, ordered=False)
+            except BulkWriteError as e:
+                # Duplicate ids are messages a previous attempt already inserted
+                if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+        now = datetime.now(UTC)
+        if thread_updates:
+            await self.threads_collection.bulk_write([
+                UpdateOne(
+                    {"session_id": session_id},
+                    {
+                        "$max": {"msg_count": payload["msg_count"], "last_updated": now},
+                        "$setOnInsert": {"thread_id": payload["thread_id"], "created_at": now}
+                    },
+                    upsert=True
+                )
+                for session_id, payload in thread_updates.items()
+            ], ordered=False)
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, *entry_ids)
+            pipe.xdel(self.stream, *entry_ids)
+            await pipe.execute()